@@ -0,0 +1,199 @@
+import math
+import os
+import threading
+import time
+
+# Admission control for the inference endpoints. A request must first pass its
+# client's token bucket, then take a slot in a bounded queue; it only runs once
+# one of `max_concurrency` inference slots is free. Anything that can't be
+# admitted is rejected immediately with a Retry-After hint instead of waiting
+# for the gunicorn timeout. The queue slot is only taken once the upload has been
+# read, so slow uploads neither count as waiting nor eat into the queue timeout.
+
+
+class Rejected(Exception):
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class Ticket:
+    """
+    Admission for one request. enqueue() takes the queue slot (call it once the body
+    has been read); entering the ticket then waits for an inference slot.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.admitted_at = None
+        self.degraded = False
+        self._queued = False
+        self._running = False
+        self._closed = False
+
+    def enqueue(self):
+        """Take a queue slot and start the queue timeout, or raise Rejected (503 queue full)."""
+        if self._closed or self._queued:
+            raise RuntimeError("Ticket already queued")
+        self.controller._join_queue()
+        self._queued = True
+        self.admitted_at = time.monotonic()
+        return self
+
+    def cancel(self):
+        """Give the queue slot back without running (e.g. the request turned out invalid)."""
+        if not self._closed and not self._running:
+            self._closed = True
+            if self._queued:
+                self.controller._leave_queue()
+
+    def __enter__(self):
+        c = self.controller
+        if self._closed or not self._queued:
+            raise RuntimeError("Ticket not queued")
+        remaining = c.queue_timeout - (time.monotonic() - self.admitted_at)
+        if remaining <= 0 or not c._slots.acquire(timeout=remaining):
+            self._closed = True
+            c._leave_queue()
+            raise Rejected(503, "Server busy, request timed out in queue", c.estimated_wait())
+        self._running = True
+        self.started_at = time.monotonic()
+        c._start()
+        # Decide once per request: skip the expensive extras while others are waiting
+        self.degraded = c.saturated()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._running:
+            self._running = False
+            self._closed = True
+            self.controller._finish(time.monotonic() - self.started_at)
+        return False
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency=2, max_queue=16, queue_timeout=30.0,
+                 rate_per_minute=60.0, burst=10, degrade_queue_fraction=0.5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.degrade_at = max(1, int(max_queue * degrade_queue_fraction))
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._queued = 0       # admitted, not yet finished (waiting + running)
+        self._running = 0
+        self._service_time = 1.0  # EWMA of seconds per request, for Retry-After
+        self._buckets = {}     # client -> (tokens, last refill time)
+
+    # --- admission -------------------------------------------------------
+    def admit(self, client_id):
+        """
+        Cheap check before the body is read: raise Rejected (429 rate limited / 503 queue
+        full) or return a Ticket. The queue slot itself is taken by Ticket.enqueue(). Never blocks.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.rate > 0:
+                tokens, last = self._buckets.get(client_id, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens < 1:
+                    self._buckets[client_id] = (tokens, now)
+                    raise Rejected(429, "Rate limit exceeded", (1 - tokens) / self.rate)
+                self._buckets[client_id] = (tokens - 1, now)
+                if len(self._buckets) > 10000:
+                    self._prune_buckets(now)
+
+            self._check_room()
+        return Ticket(self)
+
+    def saturated(self):
+        with self._lock:
+            return self._queued - self._running >= self.degrade_at
+
+    def estimated_wait(self):
+        with self._lock:
+            return self._estimated_wait()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._running,
+                'waiting': self._queued - self._running,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'avg_service_seconds': round(self._service_time, 3),
+            }
+
+    # --- bookkeeping (called by Ticket) ----------------------------------
+    def _start(self):
+        with self._lock:
+            self._running += 1
+
+    def _finish(self, elapsed):
+        with self._lock:
+            self._running -= 1
+            self._queued -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+        self._slots.release()
+
+    def _check_room(self):
+        if self._queued >= self.max_queue + self.max_concurrency:
+            raise Rejected(503, "Server busy, try again later", self._estimated_wait())
+
+    def _join_queue(self):
+        # Checked again: the queue may have filled up while the body was being read
+        with self._lock:
+            self._check_room()
+            self._queued += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self._queued -= 1
+
+    def _estimated_wait(self):
+        waiting = self._queued - self._running + 1
+        return self._service_time * waiting / self.max_concurrency
+
+    def _prune_buckets(self, now):
+        # Drop clients whose bucket has refilled completely; they are indistinguishable from new ones
+        full = [k for k, (tokens, last) in self._buckets.items()
+                if tokens + (now - last) * self.rate >= self.burst]
+        for k in full:
+            del self._buckets[k]
+
+
+def create_admission_from_env(server_threads=0):
+    """
+    ADMISSION_MAX_CONCURRENCY   inferences running at once (default 2)
+    ADMISSION_MAX_QUEUE         requests allowed to wait for a slot (default 16)
+    ADMISSION_QUEUE_TIMEOUT     seconds a request may wait before a 503 (default 30)
+    RATE_LIMIT_PER_MINUTE       per-client sustained rate, 0 disables (default 60)
+    RATE_LIMIT_BURST            per-client burst size (default 10)
+    DEGRADE_QUEUE_FRACTION      queue fill at which Grad-CAM/TTA are skipped (default 0.5)
+
+    `server_threads` > 0 means every waiting request holds one of that many server
+    threads (Flask under gunicorn --threads). The queue is then capped at
+    server_threads - max_concurrency - 1: one thread always stays free to send the 503,
+    otherwise overflow would sit in gunicorn's socket backlog and never be rejected.
+    """
+    max_concurrency = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', 2))
+    max_queue = int(os.environ.get('ADMISSION_MAX_QUEUE', 16))
+    if server_threads > 0:
+        limit = max(1, server_threads - max_concurrency - 1)
+        if max_queue > limit:
+            print(f"Admission queue capped at {limit} ({server_threads} server threads, "
+                  f"{max_concurrency} inference slots)")
+            max_queue = limit
+    return AdmissionController(
+        max_concurrency=max_concurrency,
+        max_queue=max_queue,
+        queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 30)),
+        rate_per_minute=float(os.environ.get('RATE_LIMIT_PER_MINUTE', 60)),
+        burst=int(os.environ.get('RATE_LIMIT_BURST', 10)),
+        degrade_queue_fraction=float(os.environ.get('DEGRADE_QUEUE_FRACTION', 0.5)),
+    )
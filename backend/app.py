@@ -2,17 +2,31 @@ import os
 import cv2
 import numpy as np
 import tensorflow as tf
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, send_from_directory, Response, abort
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import sys
+import time
+import mimetypes
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from io import BytesIO
 
 # Add parent directory to path to import modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from train import build_simple_cnn
-from gradcam.utils import make_gradcam_heatmap, save_and_display_gradcam
-from report_generator import create_report
+from train import MODEL_VARIANTS
+from gradcam.utils import make_gradcam_heatmap, overlay_gradcam
+from report_generator import render_report, create_batch_report
+from tta import build_tta_batch, DEFAULT_TTA_VIEWS, TTA_VIEWS
+from embeddings import build_embedding_model, EmbeddingIndex
+from dataset.data_loader import CLASSES
+from roi_detection import build_roi_detector, crop_roi
+from sequence_model import FrameFeatureCache, build_sequence_head, predict_study, MAX_FRAMES
+from storage import create_storage_from_env, is_hashed_name, RangeNotSatisfiable, CHUNK_SIZE
+from admission import create_admission_from_env, Rejected
 
 app = Flask(__name__)
 CORS(app)
@@ -25,16 +39,79 @@ RESULT_FOLDER = os.path.join(BASE_DIR, 'frontend', 'public', 'results')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
 
+# New files go through the storage layer (content-hashed, sharded, evicted by TTL/quota).
+# Files already sitting flat in UPLOAD_FOLDER/RESULT_FOLDER are still served as before.
+storage = create_storage_from_env(os.path.join(BASE_DIR, 'frontend', 'public'))
+storage.start_cleanup(int(os.environ.get('STORAGE_CLEANUP_INTERVAL', 600)))
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+# Bounded queue + per-client rate limits in front of inference (see admission.py)
+# gunicorn --threads (Procfile). Under Flask a queued request holds one of these threads,
+# so the admission queue is sized to fit in them; 0 = no thread bound (ASGI front-end)
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+admission = create_admission_from_env(WEB_THREADS)
+# Reverse proxies in front of the app that append to X-Forwarded-For (1 on Render)
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+
+# Recently written images, keyed by their public URL, so reports don't re-read them from disk
+MEDIA_CACHE_SIZE = 128
+_media_cache = OrderedDict()
+_media_cache_lock = threading.Lock()
+
+def remember_media(url, data):
+    with _media_cache_lock:
+        _media_cache[url] = data
+        _media_cache.move_to_end(url)
+        while len(_media_cache) > MEDIA_CACHE_SIZE:
+            _media_cache.popitem(last=False)
+
+def load_media(url):
+    """Resolve an /uploads/... or /results/... URL to encoded image bytes (or None)."""
+    with _media_cache_lock:
+        data = _media_cache.get(url)
+    if data is not None:
+        return data
+
+    data = storage.load_url(url)
+    if data is None:
+        # Legacy flat file from before the storage layer
+        folders = {'uploads': UPLOAD_FOLDER, 'results': RESULT_FOLDER}
+        parts = url.strip('/').split('/', 1)
+        if len(parts) != 2 or parts[0] not in folders:
+            return None
+        path = os.path.join(folders[parts[0]], secure_filename(parts[1]))
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+    remember_media(url, data)
+    return data
+
 # Global Model
+# THYROID_MODEL=student serves the distilled compact CNN (distill.py) instead of build_simple_cnn
+MODEL_VARIANT = os.environ.get('THYROID_MODEL', 'cnn')
+if MODEL_VARIANT not in MODEL_VARIANTS:
+    raise ValueError(f"THYROID_MODEL must be one of {sorted(MODEL_VARIANTS)}, got {MODEL_VARIANT!r}")
+build_model, _weights_file = MODEL_VARIANTS[MODEL_VARIANT]
+WEIGHTS_PATH = os.path.join(BASE_DIR, _weights_file)
+# Index / study head are trained on one model's embeddings, so each variant has its own files
+ARTIFACT_SUFFIX = '' if MODEL_VARIANT == 'cnn' else f'_{MODEL_VARIANT}'
 model = None
+_model_lock = threading.Lock()
 
 def get_model():
+    if model is not None:
+        return model
+    with _model_lock: # several worker threads may ask for it at once
+        return _load_model()
+
+def _load_model():
     global model
     if model is None:
         print("Loading model lazily...")
         try:
-            model = build_simple_cnn((224, 224, 3), 5) # Multi-class (5 types)
-            weights_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'thyroid_model.h5')
+            model = build_model((224, 224, 3), 5) # Multi-class (5 types)
+            weights_path = WEIGHTS_PATH
             
             if os.path.exists(weights_path):
                 model.load_weights(weights_path)
@@ -48,106 +125,506 @@ def get_model():
 
 # Removed immediate load_model() call for Cloud Stability
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
-    
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
-    
-    # Preprocess
-    img = cv2.imread(filepath)
+# Same weights with an extra output for the penultimate Dense(128) activations,
+# so one forward pass gives both the prediction and the similar-case embedding
+_predict_model = (None, None)
+
+def get_predict_model():
+    global _predict_model
+    loaded_model = get_model()
+    if loaded_model is None:
+        return None
+    source, dual = _predict_model
+    if source is not loaded_model:
+        dual = build_embedding_model(loaded_model)
+        _predict_model = (loaded_model, dual)
+    return dual
+
+# ROI detector (train it with `python roi_detection.py`); without weights the whole frame is classified
+ROI_DETECTOR_PATH = os.path.join(BASE_DIR, 'models', 'roi_detector.weights.h5')
+roi_detector = None
+
+def get_roi_detector():
+    global roi_detector
+    if roi_detector is None and os.path.exists(ROI_DETECTOR_PATH):
+        with _model_lock:
+            if roi_detector is None:
+                detector = build_roi_detector()
+                detector.load_weights(ROI_DETECTOR_PATH)
+                roi_detector = detector
+    return roi_detector
+
+def crop_to_roi(img, with_roi=True):
+    """Nodule crop of a decoded image (what the classifier was trained on) and its box; the whole frame if off or no detector."""
+    detector = get_roi_detector() if with_roi else None
+    if detector is None:
+        return img, None
+    return crop_roi(img, detector)
+
+# Similar-case index over the labelled dataset (build it with `python embeddings.py`)
+DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
+EMBEDDING_INDEX_PATH = os.environ.get('EMBEDDING_INDEX', os.path.join(BASE_DIR, 'models', f'embedding_index{ARTIFACT_SUFFIX}.npz'))
+similar_index = None
+if os.path.exists(EMBEDDING_INDEX_PATH):
+    similar_index = EmbeddingIndex.load(EMBEDDING_INDEX_PATH)
+    print(f"Similar-case index loaded: {len(similar_index)} images")
+
+# Embeddings of recent uploads, keyed by stored filename, so /similar needs no second pass
+EMBEDDING_CACHE_SIZE = 512
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+def remember_embedding(filename, vector):
+    with _embedding_cache_lock:
+        _embedding_cache[filename] = vector
+        _embedding_cache.move_to_end(filename)
+        while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+
+def save_upload(original_filename, data):
+    """Store uploaded bytes under their content hash. Returns (stored filename, extension)."""
+    ext = os.path.splitext(secure_filename(original_filename))[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        ext = '.jpg'
+    # Content-hashed name: same upload -> same file, different uploads never overwrite each other
+    filename = storage.put('uploads', data, ext)
+    remember_media(f"/uploads/{filename}", data)
+    return filename, ext
+
+def get_recommendation(result):
+    # Recommendation Logic
+    if result == 'Benign':
+        recommendation = "Follow-up scan / Routine monitoring"
+    elif result == 'Papillary Thyroid Carcinoma':
+        recommendation = "FNAC / Possible Lobectomy"
+    elif result == 'Follicular Thyroid Carcinoma':
+        recommendation = "Diagnostic Hemithyroidectomy / Histopathology"
+    elif result == 'Anaplastic Thyroid Carcinoma':
+        recommendation = "Urgent Oncologist Referral / Palliative Care"
+    elif result == 'Medullary Thyroid Carcinoma':
+        recommendation = "Serum Calcitonin Test / Total Thyroidectomy"
+    else:
+        recommendation = "Clinical Correlation Required"
+    return recommendation
+
+def parse_roi(value):
+    """'roi' request field: ROI cropping is on unless explicitly turned off (e.g. for pre-cropped images)."""
+    return value is None or str(value).strip().lower() not in ('0', 'false', 'no', 'off')
+
+def parse_tta(value):
+    """'tta' request field: a number of views, or true/false. Returns the view count (0 = off)."""
+    if value is None or str(value).strip().lower() in ('', '0', 'false', 'no', 'off'):
+        return 0
+    value = str(value).strip().lower()
+    if value in ('true', 'yes', 'on'):
+        return DEFAULT_TTA_VIEWS
+    try:
+        return max(0, min(int(value), len(TTA_VIEWS)))
+    except ValueError:
+        return 0
+
+def analyze_upload(filename, ext, data, tta_views=0, with_gradcam=True, with_roi=True):
+    """
+    Classify an uploaded image and render its Grad-CAM overlay.
+    With tta_views > 1 the probabilities are averaged over that many augmented views;
+    with_gradcam=False (degraded mode) returns heatmap_url None.
+    With with_roi the nodule region is detected and cropped first; its box is returned as 'roi'.
+    Returns (JSON payload, HTTP status); shared by the Flask and ASGI front-ends.
+    """
+    # Preprocess (decode straight from the uploaded bytes)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return {'error': 'Unsupported image format'}, 400
+    # Classify the nodule crop, like the training images, rather than the whole frame
+    img, roi = crop_to_roi(img, with_roi)
     img_resized = cv2.resize(img, (224, 224))
     img_array = np.expand_dims(img_resized / 255.0, axis=0) # Normalize
     
     # Predict
     loaded_model = get_model()
     if loaded_model:
-        preds = loaded_model.predict(img_array)
-        class_idx = np.argmax(preds[0])
-        confidence = float(preds[0][class_idx])
-        
-        labels = [
-            'Benign', 
-            'Papillary Thyroid Carcinoma', 
-            'Follicular Thyroid Carcinoma', 
-            'Anaplastic Thyroid Carcinoma',
-            'Medullary Thyroid Carcinoma'
-        ]
+        # TTA views (if any) go through the model as one batch; view 0 is the original image
+        batch = build_tta_batch(img_array[0], tta_views) if tta_views > 1 else img_array
+        embeddings, probs = get_predict_model()(batch, training=False)
+        probs = np.asarray(probs).mean(axis=0)
+        if with_roi:
+            # /similar embeds cache misses with the ROI crop too, so only cache what it would compute
+            remember_embedding(filename, np.asarray(embeddings)[0])
+        class_idx = np.argmax(probs)
+        confidence = float(probs[class_idx])
         
         # Safety check if index out of range (in case model mismatch during dev)
-        if class_idx >= len(labels):
+        if class_idx >= len(CLASSES):
             result = "Unknown"
         else:
-            result = labels[class_idx]
+            result = CLASSES[class_idx]
         
-        # Grad-CAM
-        try:
-            # We explicitly named the layer 'target_conv_layer' in train.py (Functional API)
-            heatmap = make_gradcam_heatmap(img_array, loaded_model, 'target_conv_layer')
-            heatmap_filename = f"heatmap_{filename}"
-            heatmap_path = os.path.join(RESULT_FOLDER, heatmap_filename)
-            save_and_display_gradcam(filepath, heatmap, heatmap_path)
-            
-            # Recommendation Logic
-            if result == 'Benign':
-                recommendation = "Follow-up scan / Routine monitoring"
-            elif result == 'Papillary Thyroid Carcinoma':
-                recommendation = "FNAC / Possible Lobectomy"
-            elif result == 'Follicular Thyroid Carcinoma':
-                recommendation = "Diagnostic Hemithyroidectomy / Histopathology"
-            elif result == 'Anaplastic Thyroid Carcinoma':
-                recommendation = "Urgent Oncologist Referral / Palliative Care"
-            elif result == 'Medullary Thyroid Carcinoma':
-                recommendation = "Serum Calcitonin Test / Total Thyroidectomy"
-            else:
-                recommendation = "Clinical Correlation Required"
-            
-            # Determine high-level diagnosis
-            diagnosis = "Benign" if result == "Benign" else "Malignant"
-            
-            heatmap_url = f"/results/{heatmap_filename}"
-            original_url = f"/uploads/{filename}"
+        # Grad-CAM (skipped in degraded mode, when the server is saturated)
+        heatmap_url = None
+        if with_gradcam:
+            try:
+                # We explicitly named the layer 'target_conv_layer' in train.py (Functional API)
+                heatmap = make_gradcam_heatmap(img_array, loaded_model, 'target_conv_layer')
+                ok, encoded = cv2.imencode(ext, overlay_gradcam(img, heatmap))
+                if not ok:
+                    raise ValueError("could not encode heatmap")
+                heatmap_bytes = encoded.tobytes()
+                heatmap_filename = storage.put('results', heatmap_bytes, ext)
+                remember_media(f"/results/{heatmap_filename}", heatmap_bytes)
+                heatmap_url = f"/results/{heatmap_filename}"
+            except Exception as e:
+                 return {'error': f"Grad-CAM failed: {str(e)}"}, 500
             
-            print(f"DEBUG: Returning Heatmap URL: {heatmap_url}")
-            print(f"DEBUG: Returning Original URL: {original_url}")
-
-            return jsonify({
-                'result': result, # Specific subtype (e.g. Papillary...)
-                'diagnosis': diagnosis, # High level (Benign/Malignant) for UI coloring
-                'confidence': f"{confidence*100:.2f}%",
-                'recommendation': recommendation,
-                'heatmap_url': heatmap_url,
-                'original_url': original_url
-            })
-        except Exception as e:
-             return jsonify({'error': f"Grad-CAM failed: {str(e)}"}), 500
+        recommendation = get_recommendation(result)
+        
+        # Determine high-level diagnosis
+        diagnosis = "Benign" if result == "Benign" else "Malignant"
+        
+        original_url = f"/uploads/{filename}"
+        
+        print(f"DEBUG: Returning Heatmap URL: {heatmap_url}")
+        print(f"DEBUG: Returning Original URL: {original_url}")
+
+        return {
+            'result': result, # Specific subtype (e.g. Papillary...)
+            'diagnosis': diagnosis, # High level (Benign/Malignant) for UI coloring
+            'confidence': f"{confidence*100:.2f}%",
+            'recommendation': recommendation,
+            'heatmap_url': heatmap_url,
+            'original_url': original_url,
+            'similar_url': f"/similar?upload={filename}",
+            'tta_views': tta_views if tta_views > 1 else 1,
+            'roi': list(roi) if roi else None, # [x1, y1, x2, y2] in the original image, None = whole frame
+            'degraded': not with_gradcam
+        }, 200
     else:
-        return jsonify({'error': "Model not loaded"}), 500
+        return {'error': "Model not loaded"}, 500
+
+def client_id(headers, remote_addr):
+    # Only the entry appended by our own proxy can be trusted; anything to its left is
+    # whatever the client sent and would let it pick a fresh rate-limit bucket per request
+    if TRUSTED_PROXY_HOPS > 0:
+        hops = [h.strip() for h in headers.get('X-Forwarded-For', '').split(',') if h.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return remote_addr or 'unknown'
+
+def rejection_response(rejected):
+    response = jsonify({'error': rejected.message})
+    response.status_code = rejected.status
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    # Rate limit / queue-full check before the upload body is parsed, so shed requests cost almost nothing
+    try:
+        ticket = admission.admit(client_id(request.headers, request.remote_addr))
+    except Rejected as e:
+        return rejection_response(e)
+
+    # Parsing the body may fail (e.g. client gone mid-upload); the slot must come back either way
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file part'}), 400
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+
+        data = file.read()
+        # Only now take the queue slot: upload time must not count as queue time
+        ticket.enqueue()
+        with ticket:
+            filename, ext = save_upload(file.filename, data)
+            # Degraded mode: no Grad-CAM or TTA while requests are queueing up
+            tta_views = 0 if ticket.degraded else parse_tta(request.values.get('tta'))
+            payload, status = analyze_upload(filename, ext, data, tta_views, with_gradcam=not ticket.degraded,
+                                             with_roi=parse_roi(request.values.get('roi')))
+    except Rejected as e:
+        return rejection_response(e)
+    finally:
+        ticket.cancel()  # no-op once the ticket has run
+    return jsonify(payload), status
+
+def report_filename(data):
+    return secure_filename(f"report_{data.get('id', 'temp')}.pdf")
+
+# Study-level (multi-frame) model: cached per-frame embeddings + LSTM head (see sequence_model.py)
+STUDY_HEAD_PATH = os.path.join(BASE_DIR, 'models', f'study_head{ARTIFACT_SUFFIX}.weights.h5')
+# Memory-only LRU: uploads would otherwise leave one .npy per frame on disk forever.
+# Both sets of weights are fixed for the life of the process, so no tag is needed.
+frame_cache = FrameFeatureCache(cache_dir=None)
+study_head = None
+
+def get_study_head(embedding_dim):
+    global study_head
+    if study_head is None and os.path.exists(STUDY_HEAD_PATH):
+        with _model_lock:
+            if study_head is None:
+                head = build_sequence_head(embedding_dim, len(CLASSES))
+                head.load_weights(STUDY_HEAD_PATH)
+                study_head = head
+    return study_head
+
+@app.route('/predict_study', methods=['POST'])
+def predict_study_route():
+    try:
+        ticket = admission.admit(client_id(request.headers, request.remote_addr))
+    except Rejected as e:
+        return rejection_response(e)
+
+    try:
+        files = [f for f in request.files.getlist('files') if f.filename]
+        if not files:
+            return jsonify({'error': "No frames uploaded (use the 'files' field)"}), 400
+        if len(files) > MAX_FRAMES:
+            return jsonify({'error': f"At most {MAX_FRAMES} frames per study"}), 400
+
+        frames = [f.read() for f in files]
+        ticket.enqueue()
+        with ticket:
+            predict_model = get_predict_model()
+            head = get_study_head(predict_model.outputs[0].shape[-1]) if predict_model else None
+            if head is None:
+                return jsonify({'error': "Study model not available (run sequence_model.py)"}), 503
+
+            original_urls = [f"/uploads/{save_upload(f.filename, data)[0]}" for f, data in zip(files, frames)]
+            # Frames seen before (same bytes) skip the CNN; only the LSTM head always runs
+            try:
+                probs = predict_study(frames, predict_model, head, frame_cache,
+                                      preprocess=lambda img: crop_to_roi(img)[0])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+    except Rejected as e:
+        return rejection_response(e)
+    finally:
+        ticket.cancel()
+
+    class_idx = int(np.argmax(probs))
+    result = CLASSES[class_idx] if class_idx < len(CLASSES) else "Unknown"
+    return jsonify({
+        'result': result,
+        'diagnosis': "Benign" if result == "Benign" else "Malignant",
+        'confidence': f"{float(probs[class_idx])*100:.2f}%",
+        'recommendation': get_recommendation(result),
+        'frames': len(frames),
+        'original_urls': original_urls
+    })
+
+@app.route('/similar', methods=['GET'])
+def similar():
+    filename = os.path.basename(request.args.get('upload', ''))
+    k = max(1, min(request.args.get('k', 5, type=int), 50))
+    if similar_index is None or len(similar_index) == 0:
+        return jsonify({'error': 'Similar-case index not built (run embeddings.py)'}), 503
+
+    start = time.perf_counter()
+    with _embedding_cache_lock:
+        vector = _embedding_cache.get(filename)
+    if vector is None:
+        # Not predicted recently (or evicted): embed the stored upload once
+        data = load_media(f"/uploads/{filename}") if filename else None
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+        if img is None:
+            return jsonify({'error': 'Unknown upload'}), 404
+        predict_model = get_predict_model()
+        if predict_model is None:
+            return jsonify({'error': "Model not loaded"}), 500
+        # Same crop as /predict, so the neighbours don't depend on whether the embedding was cached
+        img, _ = crop_to_roi(img)
+        embeddings, _ = predict_model(np.expand_dims(cv2.resize(img, (224, 224)) / 255.0, axis=0), training=False)
+        vector = np.asarray(embeddings)[0]
+        remember_embedding(filename, vector)
+
+    matches = similar_index.search(vector, k)
+    return jsonify({
+        'similar': [
+            {'url': f"/dataset/{path}", 'label': CLASSES[label], 'similarity': round(score, 4)}
+            for path, label, score in matches
+        ],
+        'took_ms': round(1000 * (time.perf_counter() - start), 2)
+    })
+
+@app.route('/dataset/<path:relpath>')
+def dataset_file(relpath):
+    # Labelled reference images returned by /similar
+    if not relpath.lower().endswith(('.png', '.jpg', '.jpeg')):
+        abort(404)
+    return send_from_directory(DATASET_DIR, relpath, max_age=24 * 3600)
+
+def invalid_report(data):
+    """Error message if `data` isn't a usable report payload, else None."""
+    if not isinstance(data, dict):
+        return 'Request body must be a JSON object'
+    if not isinstance(data.get('prediction') or {}, dict):
+        return "'prediction' must be a JSON object"
+    return None
 
 @app.route('/generate_report', methods=['POST'])
 def generate_report():
-    data = request.json
-    report_path = os.path.join(RESULT_FOLDER, f"report_{data.get('id', 'temp')}.pdf")
-    create_report(report_path, data, data.get('prediction', {}))
-    return send_file(report_path, as_attachment=True)
+    data = request.get_json(silent=True)
+    error = invalid_report(data)
+    if error:
+        return jsonify({'error': error}), 400
+    # Rendered into memory and streamed back; nothing is written to RESULT_FOLDER
+    pdf = render_report(data, data.get('prediction') or {}, image_loader=load_media)
+    return send_file(
+        BytesIO(pdf),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=report_filename(data)
+    )
+
+# Batch report jobs run in the background so the request thread is released immediately
+MAX_BATCH_JOBS = 16
+_batch_executor = ThreadPoolExecutor(max_workers=2)
+_batch_jobs = OrderedDict()
+_batch_jobs_lock = threading.Lock()
+
+def _run_batch_job(job_id, reports, output_format):
+    job = _batch_jobs[job_id]
+
+    def progress(done, total):
+        job['done'] = done
+
+    try:
+        job['status'] = 'running'
+        job['result'] = create_batch_report(reports, image_loader=load_media,
+                                            output_format=output_format, progress=progress)
+        job['status'] = 'done'
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+
+@app.route('/generate_batch_report', methods=['POST'])
+def generate_batch_report():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    reports = data.get('reports')
+    output_format = data.get('format', 'pdf')
+    if not isinstance(reports, list) or not reports:
+        return jsonify({'error': "'reports' must be a non-empty list"}), 400
+    # Validate every entry now rather than failing the job later
+    for i, entry in enumerate(reports):
+        if not isinstance(entry, dict):
+            return jsonify({'error': f"reports[{i}] must be a JSON object"}), 400
+        error = invalid_report(entry)
+        if error:
+            return jsonify({'error': f"reports[{i}]: {error}"}), 400
+    if output_format not in ('pdf', 'zip'):
+        return jsonify({'error': "'format' must be 'pdf' or 'zip'"}), 400
+
+    job_id = uuid.uuid4().hex
+    with _batch_jobs_lock:
+        _batch_jobs[job_id] = {'status': 'queued', 'done': 0, 'total': len(reports), 'format': output_format}
+        # Forget the oldest finished jobs so results don't pile up in memory
+        while len(_batch_jobs) > MAX_BATCH_JOBS:
+            oldest = next((k for k, j in _batch_jobs.items() if j['status'] in ('done', 'failed')), None)
+            if oldest is None:
+                break
+            del _batch_jobs[oldest]
+    _batch_executor.submit(_run_batch_job, job_id, reports, output_format)
+    return jsonify({'job_id': job_id, 'status_url': f"/batch_reports/{job_id}"}), 202
+
+@app.route('/batch_reports/<job_id>', methods=['GET'])
+def batch_report_status(job_id):
+    job = _batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    status = {k: job[k] for k in ('status', 'done', 'total', 'format')}
+    if 'error' in job:
+        status['error'] = job['error']
+    if job['status'] == 'done':
+        status['download_url'] = f"/batch_reports/{job_id}/download"
+    return jsonify(status)
+
+@app.route('/batch_reports/<job_id>/download', methods=['GET'])
+def batch_report_download(job_id):
+    job = _batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Job is {job['status']}"}), 409
+    is_zip = job['format'] == 'zip'
+    return send_file(
+        BytesIO(job['result']),
+        mimetype='application/zip' if is_zip else 'application/pdf',
+        as_attachment=True,
+        download_name=f"reports_{job_id}.{'zip' if is_zip else 'pdf'}"
+    )
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'running', 'model_loaded': model is not None})
+    return jsonify({'status': 'running', 'model_loaded': model is not None, 'model': MODEL_VARIANT,
+                    'load': admission.stats()})
+
+# Stored names are content hashes, so a given URL never changes and can be cached for good
+STORED_MAX_AGE = 365 * 24 * 3600
+
+def _cache_forever(response):
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def stream_stored(stored):
+    with stored:
+        while True:
+            chunk = stored.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+def send_stored(category, legacy_folder, filename):
+    # send_file answers conditional (ETag / If-Modified-Since) and Range requests itself
+    # Same content-hash ETag for local and remote files (mtime changes on re-upload, the bytes don't)
+    etag = os.path.splitext(filename)[0]
+    path = storage.local_path(category, filename)
+    if path:
+        return _cache_forever(send_file(path, conditional=True, etag=etag, max_age=STORED_MAX_AGE))
+
+    if is_hashed_name(filename) and etag in request.if_none_match:
+        return _cache_forever(Response(status=304, headers={'ETag': f'"{etag}"'}))
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    byte_range = request.range
+    # Single byte ranges are fetched from the backend as ranges; multi-range requests get the whole object
+    if byte_range is not None and byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+        try:
+            opened = storage.open_range(category, filename, byte_range.to_header())
+        except RangeNotSatisfiable:
+            abort(416)
+        if opened is not None:
+            stored, content_range = opened
+            response = Response(stream_stored(stored), status=206, mimetype=mimetype)
+            response.headers['Content-Range'] = content_range
+            response.headers['Accept-Ranges'] = 'bytes'
+            response.set_etag(etag)
+            response.cache_control.max_age = STORED_MAX_AGE
+            return _cache_forever(response)
+
+    stored = storage.open(category, filename)
+    if stored is None:
+        # Legacy flat file from before the storage layer (may be overwritten, so revalidate)
+        path = os.path.join(legacy_folder, secure_filename(filename))
+        if not os.path.isfile(path):
+            abort(404)
+        return send_file(path, conditional=True, etag=True, max_age=0)
+
+    # Remote backend: stream the object through in chunks
+    response = Response(stream_stored(stored), mimetype=mimetype)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.set_etag(etag)
+    response.cache_control.max_age = STORED_MAX_AGE
+    return _cache_forever(response)
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_file(os.path.join(UPLOAD_FOLDER, filename))
+    return send_stored('uploads', UPLOAD_FOLDER, filename)
 
 @app.route('/results/<filename>')
 def result_file(filename):
-    return send_file(os.path.join(RESULT_FOLDER, filename))
+    return send_stored('results', RESULT_FOLDER, filename)
 
 if __name__ == '__main__':
     print("Starting Flask Server...")
@@ -0,0 +1,123 @@
+import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, Mount
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+# Add current directory to path so we can import 'app' / 'production'
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Async front-end for the API. Uploads are read by the event loop, so a slow client
+# only costs a coroutine instead of a worker thread. Inference and Grad-CAM run on
+# a small dedicated executor; every other route falls through to the Flask app.
+#
+# Run with:  uvicorn backend.asgi:app --host 0.0.0.0 --port 5000
+#       or:  gunicorn -k uvicorn.workers.UvicornWorker backend.asgi:app
+
+# Waiting /predict requests are parked on the event loop, not on server threads, so the
+# admission queue isn't limited by a thread count here (see create_admission_from_env)
+os.environ.setdefault('WEB_THREADS', '0')
+
+import app as flask_backend
+from production import app as flask_app  # includes the static frontend routes
+from admission import Rejected
+
+# One executor thread per admission slot, so admitted requests never wait behind each other twice
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', flask_backend.admission.max_concurrency))
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix='inference')
+
+
+async def run_inference(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, func, *args)
+
+
+def rejection_response(rejected):
+    return JSONResponse({'error': rejected.message}, status_code=rejected.status,
+                        headers={'Retry-After': str(rejected.retry_after)})
+
+
+def run_admitted(ticket, filename, ext, data, tta_views, with_roi):
+    # Runs on the inference executor; waits for a slot (or times out) inside the ticket
+    with ticket:
+        if ticket.degraded:
+            return flask_backend.analyze_upload(filename, ext, data, 0, with_gradcam=False, with_roi=with_roi)
+        return flask_backend.analyze_upload(filename, ext, data, tta_views, with_roi=with_roi)
+
+
+async def predict(request):
+    peer = request.client.host if request.client else None
+    try:
+        ticket = flask_backend.admission.admit(flask_backend.client_id(request.headers, peer))
+    except Rejected as e:
+        return rejection_response(e)
+
+    try:
+        # Multipart body is consumed asynchronously and spooled to a temp file if large
+        form = await request.form()
+        file = form.get('file')
+        if file is None or isinstance(file, str):
+            return JSONResponse({'error': 'No file part'}, status_code=400)
+        if not file.filename:
+            return JSONResponse({'error': 'No selected file'}, status_code=400)
+
+        data = await file.read()
+        tta_views = flask_backend.parse_tta(form.get('tta', request.query_params.get('tta')))
+        with_roi = flask_backend.parse_roi(form.get('roi', request.query_params.get('roi')))
+        await form.close()
+        # Body fully received: only now take the queue slot and start the queue timeout
+        ticket.enqueue()
+        filename, ext = await run_in_threadpool(flask_backend.save_upload, file.filename, data)
+        payload, status = await run_inference(run_admitted, ticket, filename, ext, data, tta_views, with_roi)
+        return JSONResponse(payload, status_code=status)
+    except Rejected as e:
+        return rejection_response(e)
+    finally:
+        ticket.cancel()  # no-op once the ticket has run
+
+
+async def generate_report(request):
+    try:
+        data = await request.json()
+    except ValueError:  # json.JSONDecodeError, or a body that isn't UTF-8
+        data = None
+    error = flask_backend.invalid_report(data)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    pdf = await run_in_threadpool(
+        flask_backend.render_report, data, data.get('prediction') or {}, flask_backend.load_media
+    )
+    filename = flask_backend.report_filename(data)
+    return Response(pdf, media_type='application/pdf',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+async def health(request):
+    return JSONResponse({'status': 'running', 'model_loaded': flask_backend.model is not None,
+                         'model': flask_backend.MODEL_VARIANT, 'load': flask_backend.admission.stats()})
+
+
+app = Starlette(
+    routes=[
+        Route('/predict', predict, methods=['POST']),
+        Route('/generate_report', generate_report, methods=['POST']),
+        Route('/health', health, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    print("Starting ASGI Server on http://localhost:5000")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
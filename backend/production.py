@@ -1,27 +1,61 @@
 import os
 import sys
-from flask import send_from_directory
+from flask import send_file, request, abort
 
 # Add current directory to path so we can import 'app'
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app import app
+from static_assets import FRONTEND_DIST, build_static_index
 
 # Configuration for Production
-# Point to the 'dist' folder generated by 'npm run build'
-FRONTEND_DIST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'dist')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+STATIC_INDEX = build_static_index()
+print(f"Serving Frontend from: {FRONTEND_DIST} ({len(STATIC_INDEX)} files indexed)")
+
+
+def send_static(entry):
+    # Prefer a precompressed variant the client accepts
+    encoding = next((enc for enc in entry['variants'] if request.accept_encodings[enc] > 0), None)
+    file_path = entry['variants'][encoding] if encoding else entry['path']
+    etag = f"{entry['etag']}-{encoding}" if encoding else entry['etag']
+
+    # conditional=True answers If-None-Match/If-Modified-Since with 304 and honours Range
+    response = send_file(
+        file_path,
+        mimetype=entry['mimetype'],
+        download_name=os.path.basename(entry['path']),
+        etag=etag,
+        last_modified=entry['last_modified'],
+        conditional=True,
+        max_age=IMMUTABLE_MAX_AGE if entry['immutable'] else 0,
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if entry['variants']:
+        response.vary.add('Accept-Encoding')
+    if entry['immutable']:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        # index.html and friends: always revalidate so new deploys show up
+        response.cache_control.no_cache = True
+    return response
 
-print(f"Serving Frontend from: {FRONTEND_DIST}")
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    # Check if path exists in dist folder
-    if path != "" and os.path.exists(os.path.join(FRONTEND_DIST, path)):
-        return send_from_directory(FRONTEND_DIST, path)
-    else:
+    entry = STATIC_INDEX.get(path)
+    if entry is None:
         # Fallback to index.html for SPA routing (and root)
-        return send_from_directory(FRONTEND_DIST, 'index.html')
+        entry = STATIC_INDEX.get('index.html')
+        if entry is None:
+            abort(404)
+    return send_static(entry)
+
 
 if __name__ == '__main__':
     from waitress import serve
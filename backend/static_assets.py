@@ -0,0 +1,71 @@
+import os
+import re
+import sys
+import gzip
+import mimetypes
+
+# Build-time helpers for the frontend bundle. Kept apart from production.py so that
+# precompressing dist doesn't import the app (TensorFlow, storage, cleanup thread).
+
+# Point to the 'dist' folder generated by 'npm run build'
+FRONTEND_DIST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'dist')
+
+# Vite emits fingerprinted bundles like assets/index-B3xk9aQz.js; those never change
+HASHED_ASSET = re.compile(r'(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$')
+COMPRESSIBLE_TYPES = ('.html', '.js', '.mjs', '.css', '.svg', '.json', '.txt', '.map', '.ico')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+try:
+    import brotli  # optional: only used to build .br variants
+except ImportError:
+    brotli = None
+
+
+def precompress_dist(dist_dir=FRONTEND_DIST, min_size=1024):
+    """Write .gz (and .br when brotli is installed) next to every compressible asset."""
+    count = 0
+    for root, _, files in os.walk(dist_dir):
+        for fname in files:
+            path = os.path.join(root, fname)
+            if not fname.endswith(COMPRESSIBLE_TYPES) or os.path.getsize(path) < min_size:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data))
+            count += 1
+    return count
+
+
+def build_static_index(dist_dir=FRONTEND_DIST):
+    """Stat every file in dist once so requests never touch the filesystem to look them up."""
+    index = {}
+    if not os.path.isdir(dist_dir):
+        print(f"WARNING: {dist_dir} not found, run 'npm run build' first.")
+        return index
+
+    for root, _, files in os.walk(dist_dir):
+        for fname in files:
+            if fname.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(root, fname)
+            rel = os.path.relpath(path, dist_dir).replace(os.sep, '/')
+            st = os.stat(path)
+            index[rel] = {
+                'path': path,
+                'mimetype': mimetypes.guess_type(fname)[0] or 'application/octet-stream',
+                'etag': f"{st.st_mtime_ns:x}-{st.st_size:x}",
+                'last_modified': st.st_mtime,
+                'immutable': HASHED_ASSET.search(rel) is not None,
+                'variants': {enc: path + suffix for enc, suffix in ENCODINGS if os.path.isfile(path + suffix)},
+            }
+    return index
+
+
+if __name__ == '__main__':
+    # Run after 'npm run build': python backend/static_assets.py [dist_dir]
+    dist_dir = sys.argv[1] if len(sys.argv) > 1 else FRONTEND_DIST
+    print(f"Precompressed {precompress_dist(dist_dir)} files in {dist_dir}")
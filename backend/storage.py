@@ -0,0 +1,396 @@
+import io
+import os
+import re
+import time
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+# Uploads and Grad-CAM results are stored under content-hashed names
+# (e.g. /uploads/3fa4...e1.jpg) so identical files never collide and
+# a name always refers to the same bytes. Objects are sharded into
+# two levels of sub-directories/prefixes taken from the hash.
+
+CATEGORIES = ('uploads', 'results')
+HASH_LENGTH = 32
+CHUNK_SIZE = 64 * 1024
+_HASHED_NAME = re.compile(r'^[0-9a-f]{%d}\.[a-z0-9]{1,5}$' % HASH_LENGTH)
+
+
+def content_name(data, ext):
+    return f"{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext.lower()}"
+
+
+def is_hashed_name(name):
+    return bool(_HASHED_NAME.match(name))
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def client_error_code(e):
+    """Error code of a boto3 ClientError (e.g. 'NoSuchKey'), or None for other exceptions."""
+    return (getattr(e, 'response', None) or {}).get('Error', {}).get('Code')
+
+
+def shard_key(category, name):
+    return f"{category}/{name[:2]}/{name[2:4]}/{name}"
+
+
+def is_shard_key(key):
+    """True for keys this module manages: <category>/xx/yy/<hashed name>."""
+    parts = key.split('/')
+    return (len(parts) == 4 and parts[0] in CATEGORIES and is_hashed_name(parts[3])
+            and key == shard_key(parts[0], parts[3]))
+
+
+class Storage:
+    """
+    Base class for upload/result storage with TTL and size-quota eviction.
+    Subclasses implement the raw object operations below.
+    """
+
+    def __init__(self, ttl_seconds=None, max_bytes=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._approx_bytes = 0
+        self._wake = threading.Event()
+        self._cleanup_thread = None
+
+    # --- raw operations --------------------------------------------------
+    def _write(self, key, data):
+        raise NotImplementedError
+
+    def _open(self, key):
+        """Return a readable binary file object, or None if missing."""
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _list(self):
+        """Yield (key, size, mtime) for every stored object."""
+        raise NotImplementedError
+
+    def local_path(self, category, name):
+        """Filesystem path for zero-copy serving, when the backend has one."""
+        return None
+
+    def _open_range(self, key, range_header):
+        """(file object, Content-Range) for one HTTP byte range; None if unsupported or missing."""
+        return None
+
+    # --- public API ------------------------------------------------------
+    def put(self, category, data, ext):
+        """Store bytes and return the content-hashed name."""
+        if category not in CATEGORIES:
+            raise ValueError(f"Unknown storage category: {category}")
+        name = content_name(data, ext)
+        self._write(shard_key(category, name), data)
+        self._approx_bytes += len(data)
+        if self.max_bytes and self._approx_bytes > self.max_bytes:
+            self._wake.set()  # let the cleanup thread enforce the quota
+        return name
+
+    def open(self, category, name):
+        if category not in CATEGORIES or not is_hashed_name(name):
+            return None
+        return self._open(shard_key(category, name))
+
+    def open_range(self, category, name, range_header):
+        """
+        Open one byte range (an HTTP Range value like 'bytes=0-99') without fetching the
+        rest. Returns (file object, Content-Range value), or None when the object is missing
+        or the backend can't do ranges (send the whole object then). Raises
+        RangeNotSatisfiable if the range starts past the end.
+        """
+        if category not in CATEGORIES or not is_hashed_name(name):
+            return None
+        return self._open_range(shard_key(category, name), range_header)
+
+    def read(self, category, name):
+        f = self.open(category, name)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def load_url(self, url):
+        """Resolve an /uploads/... or /results/... URL to bytes (or None)."""
+        parts = (url or '').strip('/').split('/', 1)
+        if len(parts) != 2:
+            return None
+        return self.read(parts[0], parts[1])
+
+    def delete(self, category, name):
+        if category in CATEGORIES and is_hashed_name(name):
+            self._delete(shard_key(category, name))
+
+    # --- retention -------------------------------------------------------
+    def evict(self, now=None):
+        """Delete expired objects, then the oldest ones until under quota. Returns the count removed."""
+        now = now or time.time()
+        objects = sorted(self._list(), key=lambda o: o[2])
+        removed = 0
+        total = sum(size for _, size, _ in objects)
+
+        for key, size, mtime in objects:
+            expired = self.ttl_seconds and now - mtime > self.ttl_seconds
+            over_quota = self.max_bytes and total > self.max_bytes
+            if not (expired or over_quota):
+                # Oldest first: once one object survives both rules, the rest do too
+                break
+            self._delete(key)
+            total -= size
+            removed += 1
+
+        self._approx_bytes = total
+        return removed
+
+    def start_cleanup(self, interval_seconds=600):
+        """Run eviction periodically (and on quota pressure) in a daemon thread."""
+        if self._cleanup_thread is not None:
+            return
+
+        def loop():
+            while True:
+                self._wake.wait(interval_seconds)
+                self._wake.clear()
+                try:
+                    removed = self.evict()
+                    if removed:
+                        print(f"Storage cleanup removed {removed} files")
+                except Exception as e:
+                    print(f"Storage cleanup failed: {e}")
+
+        self._cleanup_thread = threading.Thread(target=loop, name='storage-cleanup', daemon=True)
+        self._cleanup_thread.start()
+
+
+class LocalStorage(Storage):
+    """Sharded directories on the local disk: <root>/<category>/ab/cd/<hash>.<ext>"""
+
+    def __init__(self, root, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+        for category in CATEGORIES:
+            os.makedirs(os.path.join(root, category), exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def _write(self, key, data):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)  # same content uploaded again: refresh its TTL
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _open(self, key):
+        try:
+            return open(self._path(key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def _delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _list(self):
+        # Only the hashed shards are managed; legacy flat files are left alone
+        for category in CATEGORIES:
+            base = os.path.join(self.root, category)
+            for level1 in os.scandir(base):
+                if not level1.is_dir() or len(level1.name) != 2:
+                    continue
+                for level2 in os.scandir(level1.path):
+                    if not level2.is_dir():
+                        continue
+                    for entry in os.scandir(level2.path):
+                        if entry.is_file() and is_hashed_name(entry.name):
+                            st = entry.stat()
+                            yield f"{category}/{level1.name}/{level2.name}/{entry.name}", st.st_size, st.st_mtime
+
+    def local_path(self, category, name):
+        if category not in CATEGORIES or not is_hashed_name(name):
+            return None
+        path = self._path(shard_key(category, name))
+        return path if os.path.isfile(path) else None
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3-compatible bucket. `client` only needs the boto3 subset
+    put_object / get_object / delete_object / list_objects_v2, so a boto3
+    client and LocalObjectClient below are interchangeable.
+    """
+
+    def __init__(self, client, bucket, prefix='', **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def _write(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def _open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+        except KeyError:  # LocalObjectClient
+            return None
+        except Exception as e:
+            # boto3 ClientError: only a missing key means "not found"; auth/network errors propagate
+            if client_error_code(e) in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def _open_range(self, key, range_header):
+        # S3 applies the Range itself, so only the requested bytes leave the bucket
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key, Range=range_header)
+        except KeyError:
+            return None
+        except Exception as e:
+            code = client_error_code(e)
+            if code in ('NoSuchKey', '404'):
+                return None
+            if code in ('InvalidRange', '416'):
+                raise RangeNotSatisfiable(range_header)
+            raise
+        if 'ContentRange' not in obj:
+            obj['Body'].close()
+            return None  # range ignored by the server: let the caller send everything
+        return obj['Body'], obj['ContentRange']
+
+    def _delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def _list(self):
+        # Only our hashed shards are managed; anything else in the bucket is left alone
+        for category in CATEGORIES:
+            kwargs = {'Bucket': self.bucket, 'Prefix': f"{self.prefix}{category}/"}
+            while True:
+                page = self.client.list_objects_v2(**kwargs)
+                for obj in page.get('Contents', []):
+                    key = obj['Key'][len(self.prefix):]
+                    if is_shard_key(key):
+                        yield key, obj['Size'], obj['LastModified'].timestamp()
+                if not page.get('IsTruncated'):
+                    break
+                kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+
+class LocalClientError(Exception):
+    """Shaped like botocore's ClientError so S3Storage handles both the same way."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class LocalObjectClient:
+    """Filesystem stand-in for the slice of the S3 client API used by S3Storage."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.root, bucket, *key.split('/')))
+        if not path.startswith(os.path.normpath(os.path.join(self.root, bucket))):
+            raise KeyError(key)
+        return path
+
+    def put_object(self, Bucket, Key, Body):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(Body)
+        os.replace(tmp, path)
+        return {}
+
+    def get_object(self, Bucket, Key, Range=None):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise KeyError(Key)
+        size = os.path.getsize(path)
+        if Range is None:
+            return {'Body': open(path, 'rb'), 'ContentLength': size}
+
+        # Single 'bytes=a-b' / 'bytes=a-' / 'bytes=-n' range, as S3 accepts it
+        match = re.match(r'^bytes=(\d*)-(\d*)$', Range)
+        if not match or match.groups() == ('', ''):
+            raise ValueError(f"Unsupported Range: {Range}")
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1
+        if start >= size or start > end:
+            raise LocalClientError('InvalidRange')
+        with open(path, 'rb') as f:
+            f.seek(start)
+            body = io.BytesIO(f.read(end - start + 1))
+        return {'Body': body, 'ContentLength': end - start + 1, 'ContentRange': f"bytes {start}-{end}/{size}"}
+
+    def delete_object(self, Bucket, Key):
+        try:
+            os.remove(self._path(Bucket, Key))
+        except (FileNotFoundError, KeyError):
+            pass
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None):
+        base = os.path.join(self.root, Bucket)
+        contents = []
+        for dirpath, _, files in os.walk(base):
+            for fname in files:
+                if fname.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, fname)
+                key = os.path.relpath(path, base).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    st = os.stat(path)
+                    contents.append({
+                        'Key': key,
+                        'Size': st.st_size,
+                        'LastModified': datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+                    })
+        return {'Contents': contents, 'IsTruncated': False}
+
+
+def create_storage_from_env(public_dir):
+    """
+    Build the storage backend from environment variables:
+      STORAGE_BACKEND        local (default) | s3
+      STORAGE_TTL_SECONDS    age after which files are removed (default 86400, 0 disables)
+      STORAGE_MAX_BYTES      size quota across uploads+results (default 2 GiB, 0 disables)
+      S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL   for the s3 backend
+      STORAGE_S3_LOCAL_ROOT  use the filesystem stand-in instead of boto3
+    """
+    options = {
+        'ttl_seconds': int(os.environ.get('STORAGE_TTL_SECONDS', 24 * 3600)) or None,
+        'max_bytes': int(os.environ.get('STORAGE_MAX_BYTES', 2 * 1024 ** 3)) or None,
+    }
+    backend = os.environ.get('STORAGE_BACKEND', 'local').lower()
+    if backend == 'local':
+        return LocalStorage(public_dir, **options)
+    if backend == 's3':
+        local_root = os.environ.get('STORAGE_S3_LOCAL_ROOT')
+        if local_root:
+            client = LocalObjectClient(local_root)
+        else:
+            import boto3  # optional dependency, only needed for a real bucket
+            client = boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
+        return S3Storage(client, os.environ['S3_BUCKET'], os.environ.get('S3_PREFIX', ''), **options)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
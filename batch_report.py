@@ -0,0 +1,44 @@
+import argparse
+import json
+import sys
+
+from report_generator import create_batch_report, load_public_image, PUBLIC_DIR
+from backend.storage import create_storage_from_env
+
+# Usage: python batch_report.py predictions.json -o daily_pack.pdf
+# The JSON file holds a list of /generate_report payloads ({'id', 'date', 'prediction': {...}}).
+
+def main():
+    parser = argparse.ArgumentParser(description="Render many prediction results into one report pack")
+    parser.add_argument('input', help="JSON file with a list of report payloads ('-' for stdin)")
+    parser.add_argument('-o', '--output', required=True, help="Output .pdf or .zip path")
+    parser.add_argument('--format', choices=['pdf', 'zip'], help="Defaults to the output file extension")
+    parser.add_argument('--workers', type=int, default=4, help="Parallel render processes (and image fetch threads)")
+    args = parser.parse_args()
+
+    if args.input == '-':
+        reports = json.load(sys.stdin)
+    else:
+        with open(args.input) as f:
+            reports = json.load(f)
+    output_format = args.format or ('zip' if args.output.lower().endswith('.zip') else 'pdf')
+
+    # Same storage the server writes to, falling back to legacy flat files
+    storage = create_storage_from_env(PUBLIC_DIR)
+
+    def image_loader(url):
+        data = storage.load_url(url)
+        return data if data is not None else load_public_image(url)
+
+    def progress(done, total):
+        print(f"\rRendered {done}/{total} reports", end='', flush=True)
+
+    data = create_batch_report(reports, image_loader=image_loader, output_format=output_format,
+                               max_workers=args.workers, progress=progress)
+    print()
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    print(f"Saved {len(reports)} reports to {args.output}")
+
+if __name__ == '__main__':
+    main()
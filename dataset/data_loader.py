@@ -1,5 +1,7 @@
 import cv2
 import os
+import queue
+import threading
 import numpy as np
 from tensorflow.keras.utils import Sequence
 
@@ -40,20 +42,7 @@ class ThyroidDataGenerator(Sequence):
             
             # Real-time Augmentation
             if self.shuffle: # Only augment training set (shuffle=True usually implies training)
-                # Random Horizontal Flip
-                if np.random.rand() > 0.5:
-                    img = cv2.flip(img, 1)
-                
-                # Random Rotation (+/- 20 degrees)
-                angle = np.random.uniform(-20, 20)
-                h, w = img.shape[:2]
-                M = cv2.getRotationMatrix2D((w/2, h/2), angle, 1)
-                img = cv2.warpAffine(img, M, (w, h))
-                
-                # Random Zoom (0.8 - 1.2)
-                scale = np.random.uniform(0.8, 1.2)
-                # Ensure valid crop after zoom
-                # Simpler: just resize slightly and crop center
+                img = augment_image(img)
                 
             img = img / 255.0  # Normalize
             X[i,] = img
@@ -61,10 +50,138 @@ class ThyroidDataGenerator(Sequence):
 
         return X, y
 
+def augment_image(img):
+    # Random Horizontal Flip
+    if np.random.rand() > 0.5:
+        img = cv2.flip(img, 1)
+    
+    # Random Rotation (+/- 20 degrees)
+    angle = np.random.uniform(-20, 20)
+    h, w = img.shape[:2]
+    M = cv2.getRotationMatrix2D((w/2, h/2), angle, 1)
+    img = cv2.warpAffine(img, M, (w, h))
+    
+    # Random Zoom (0.8 - 1.2)
+    scale = np.random.uniform(0.8, 1.2)
+    # Ensure valid crop after zoom
+    # Simpler: just resize slightly and crop center
+    return img
+
+class ArrayDataGenerator(Sequence):
+    """
+    Batches from an already decoded and resized uint8 array (N, H, W, 3), e.g. a
+    read-only np.load(..., mmap_mode='r') shared by several processes. `indexes`
+    selects the subset (a fold) to iterate; augmentation matches ThyroidDataGenerator.
+    """
+    def __init__(self, images, labels, indexes, batch_size=32, shuffle=True):
+        self.images = images
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.subset = np.asarray(indexes)
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(np.ceil(len(self.subset) / self.batch_size))
+
+    def __getitem__(self, index):
+        # Sorted reads keep memory-mapped access mostly sequential
+        batch = np.sort(self.indexes[index*self.batch_size:(index+1)*self.batch_size])
+        X = np.asarray(self.images[batch])
+        if self.shuffle:
+            X = np.stack([augment_image(img) for img in X])
+        return X.astype(np.float32) / 255.0, np.asarray(self.labels[batch], dtype=int)
+
+    def on_epoch_end(self):
+        self.indexes = self.subset.copy()
+        if self.shuffle:
+            np.random.shuffle(self.indexes)
+
+CLASSES = [
+    'Benign', 
+    'Papillary Thyroid Carcinoma', 
+    'Follicular Thyroid Carcinoma', 
+    'Anaplastic Thyroid Carcinoma',
+    'Medullary Thyroid Carcinoma'
+]
+
 def load_data_paths(data_dir):
-    # Assumes structure: data_dir/Benign, data_dir/Malignant/...
+    # Assumes structure: data_dir/Benign, data_dir/Papillary Thyroid Carcinoma/...
     images = []
     labels = []
-    classes = []
-    # TODO: Traverse directory and collect paths
+    classes = list(CLASSES)
+    for label_idx, cat in enumerate(classes):
+        cat_dir = os.path.join(data_dir, cat)
+        if not os.path.exists(cat_dir): continue
+        for fname in sorted(os.listdir(cat_dir)):
+            if fname.lower().endswith(('.png', '.jpg', '.jpeg')):
+                images.append(os.path.join(cat_dir, fname))
+                labels.append(label_idx)
     return images, labels, classes
+
+class MixedDataGenerator(Sequence):
+    """
+    Wraps a ThyroidDataGenerator and appends GAN samples to every real batch.
+    `generators` maps class index -> trained generator model (see gan/gan.py) and
+    `synthetic_ratio` maps class index -> synthetic samples per batch as a fraction
+    of the real batch size (e.g. {4: 0.25} adds 4 Medullary images to a batch of 16).
+    Samples are produced in memory by a background thread, so generator inference
+    overlaps with the training step and nothing is written to disk.
+    """
+    def __init__(self, base, generators, synthetic_ratio, latent_dim=100, prefetch=2):
+        self.base = base
+        self.generators = generators
+        self.latent_dim = latent_dim
+        self.counts = {
+            c: int(round(ratio * base.batch_size))
+            for c, ratio in synthetic_ratio.items()
+            if c in generators and ratio > 0
+        }
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._worker = None
+
+    def __len__(self):
+        return len(self.base)
+
+    def __getitem__(self, index):
+        X, y = self.base[index]
+        if not self.counts:
+            return X, y
+
+        X_syn, y_syn = self._next_synthetic()
+        X = np.concatenate([X, X_syn.astype(X.dtype)])
+        y = np.concatenate([y, y_syn])
+        order = np.random.permutation(len(y))
+        return X[order], y[order]
+
+    def on_epoch_end(self):
+        self.base.on_epoch_end()
+
+    def close(self):
+        self._stop.set()
+
+    def _next_synthetic(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._produce, name='gan-augmentation', daemon=True)
+            self._worker.start()
+        return self._queue.get()
+
+    def _produce(self):
+        while not self._stop.is_set():
+            images, labels = [], []
+            for c, n in self.counts.items():
+                noise = np.random.normal(size=(n, self.latent_dim)).astype(np.float32)
+                generated = np.asarray(self.generators[c](noise, training=False))
+                if generated.shape[1:3] != self.base.image_size:
+                    generated = np.stack([cv2.resize(g, self.base.image_size[::-1]) for g in generated])
+                # tanh output [-1, 1] (RGB) -> [0, 1] BGR, matching cv2.imread + /255 above
+                images.append((generated[..., ::-1] + 1.0) / 2.0)
+                labels.append(np.full(n, c, dtype=int))
+            batch = (np.concatenate(images), np.concatenate(labels))
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(batch, timeout=1)
+                    break
+                except queue.Full:
+                    continue
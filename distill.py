@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+import tensorflow as tf
+from sklearn.model_selection import train_test_split
+
+from train import MODEL_VARIANTS, build_simple_cnn, build_compact_cnn
+from dataset.data_loader import load_data_paths, ThyroidDataGenerator
+from gradcam.utils import make_gradcam_heatmap
+
+# Knowledge distillation: the compact student (build_compact_cnn) is trained on the
+# served CNN's temperature-softened predictions plus the true labels, then compared
+# with it in a parity report (agreement, accuracy, size, CPU latency/throughput).
+
+DEFAULT_STUDENT_PATH = MODEL_VARIANTS['student'][1]
+DEFAULT_REPORT_PATH = os.path.join('models', 'distill_report.json')
+
+
+def soften(probs, temperature):
+    # The models end in softmax; log-probabilities are logits up to a constant
+    return tf.nn.softmax(tf.math.log(tf.clip_by_value(probs, 1e-7, 1.0)) / temperature)
+
+
+def distill(teacher, student, train_gen, epochs=30, temperature=4.0, alpha=0.9, learning_rate=1e-3):
+    """
+    Train `student` to match `teacher` on the batches of `train_gen` (augmented, so the
+    teacher is queried on every new view). Loss: alpha * T^2 * KL(teacher_T || student_T)
+    + (1 - alpha) * cross-entropy with the labels.
+    """
+    optimizer = tf.keras.optimizers.Adam(learning_rate)
+    kl = tf.keras.losses.KLDivergence()
+    ce = tf.keras.losses.SparseCategoricalCrossentropy()
+
+    @tf.function(reduce_retracing=True)
+    def train_step(images, labels):
+        soft_targets = soften(teacher(images, training=False), temperature)
+        with tf.GradientTape() as tape:
+            probs = student(images, training=True)
+            distill_loss = kl(soft_targets, soften(probs, temperature)) * temperature ** 2
+            label_loss = ce(labels, probs)
+            loss = alpha * distill_loss + (1 - alpha) * label_loss
+        grads = tape.gradient(loss, student.trainable_variables)
+        optimizer.apply_gradients(zip(grads, student.trainable_variables))
+        return loss, distill_loss, label_loss
+
+    print(f"Distilling for {epochs} epochs (T={temperature}, alpha={alpha})...")
+    for epoch in range(epochs):
+        start = time.time()
+        totals = np.zeros(3)
+        for i in range(len(train_gen)):
+            images, labels = train_gen[i]
+            totals += [float(v) for v in train_step(tf.constant(images, tf.float32), tf.constant(labels))]
+        train_gen.on_epoch_end()
+        loss, distill_loss, label_loss = totals / max(len(train_gen), 1)
+        print(f"Epoch {epoch + 1}: {time.time() - start:.1f} sec, loss={loss:.4f}, "
+              f"distill={distill_loss:.4f}, labels={label_loss:.4f}")
+    return student
+
+
+def holdout_split(labels, val_fraction=0.2, seed=42):
+    """
+    (train indexes, held-out indexes), stratified by class so every class is represented
+    in the parity report. Falls back to a plain random split if a class has one image.
+    """
+    indexes = np.arange(len(labels))
+    counts = np.bincount(labels)
+    stratify = labels if counts[counts > 0].min() >= 2 else None
+    return train_test_split(indexes, test_size=val_fraction, stratify=stratify, random_state=seed)
+
+
+def load_images(image_paths, image_size=(224, 224)):
+    """Decoded + resized uint8 images (no augmentation); unreadable files are dropped."""
+    images, kept = [], []
+    for i, path in enumerate(image_paths):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        images.append(cv2.resize(img, image_size))
+        kept.append(i)
+    return np.asarray(images, dtype=np.uint8), kept
+
+
+def predict_all(model, images, batch_size=32):
+    probs = [np.asarray(model(images[i:i + batch_size].astype(np.float32) / 255.0, training=False))
+             for i in range(0, len(images), batch_size)]
+    return np.concatenate(probs)
+
+
+def measure_speed(model, images, repeats=20, batch_size=32):
+    """(median ms for one image, images/second at `batch_size`) after a warm-up call."""
+    single = images[:1].astype(np.float32) / 255.0
+    batch = np.resize(images, (batch_size, *images.shape[1:])).astype(np.float32) / 255.0
+    model(single, training=False)
+    model(batch, training=False)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(single, training=False)
+        times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(max(1, repeats // 4)):
+        model(batch, training=False)
+    throughput = batch_size * max(1, repeats // 4) / (time.perf_counter() - start)
+    return 1000 * float(np.median(times)), float(throughput)
+
+
+def parity_report(teacher, student, images, labels, teacher_path, student_path):
+    t_probs = predict_all(teacher, images)
+    s_probs = predict_all(student, images)
+    t_pred, s_pred = t_probs.argmax(axis=1), s_probs.argmax(axis=1)
+    labels = np.asarray(labels)
+    kl = np.sum(t_probs * (np.log(np.clip(t_probs, 1e-7, 1)) - np.log(np.clip(s_probs, 1e-7, 1))), axis=1)
+
+    report = {'images': int(len(images)),
+              'agreement': float(np.mean(t_pred == s_pred)),
+              'mean_abs_prob_diff': float(np.mean(np.abs(t_probs - s_probs))),
+              'mean_kl': float(np.mean(kl))}
+    for name, model, pred, path in (('teacher', teacher, t_pred, teacher_path),
+                                    ('student', student, s_pred, student_path)):
+        ms, throughput = measure_speed(model, images)
+        report[name] = {
+            'accuracy': float(np.mean(pred == labels)),
+            'params': int(model.count_params()),
+            'weights_mb': round(os.path.getsize(path) / 1e6, 2) if os.path.exists(path) else None,
+            'latency_ms': round(ms, 2),
+            'images_per_second': round(throughput, 1),
+        }
+    # Grad-CAM must keep working on the student (same target layer name)
+    heatmap = make_gradcam_heatmap(images[:1].astype(np.float32) / 255.0, student, 'target_conv_layer')
+    report['student']['gradcam_shape'] = list(heatmap.shape)
+    return report
+
+
+def print_report(report):
+    t, s = report['teacher'], report['student']
+    print(f"\n--- Distillation Parity Report ({report['images']} held-out images) ---")
+    print(f"Top-1 agreement with teacher: {report['agreement']:.3f}")
+    print(f"Mean |p_teacher - p_student|: {report['mean_abs_prob_diff']:.4f}   mean KL: {report['mean_kl']:.4f}")
+    print(f"{'':<20}{'teacher':>12}{'student':>12}")
+    for key, fmt in (('accuracy', '.3f'), ('params', ','), ('weights_mb', ''),
+                     ('latency_ms', '.2f'), ('images_per_second', '.1f')):
+        cell = lambda v: '-' if v is None else format(v, fmt)
+        print(f"{key:<20}{cell(t[key]):>12}{cell(s[key]):>12}")
+    print(f"Student Grad-CAM map: {'x'.join(map(str, s['gradcam_shape']))}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Distill the served CNN into the compact student and report parity")
+    parser.add_argument('--data-dir', default='dataset')
+    parser.add_argument('--teacher', default=MODEL_VARIANTS['cnn'][1])
+    parser.add_argument('--output', default=DEFAULT_STUDENT_PATH)
+    parser.add_argument('--report', default=DEFAULT_REPORT_PATH)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.9, help="Weight of the distillation term vs the label loss")
+    parser.add_argument('--val-fraction', type=float, default=0.2,
+                        help="Images held out from distillation for the parity report")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--report-only', action='store_true', help="Skip training and report on existing student weights")
+    args = parser.parse_args()
+
+    image_paths, labels, classes = load_data_paths(args.data_dir)
+    if not image_paths:
+        print("No images found!")
+        exit()
+    # Same seed -> same split, so --report-only evaluates on images the student never saw
+    train_idx, val_idx = holdout_split(np.asarray(labels), args.val_fraction, args.seed)
+    print(f"Found {len(image_paths)} images ({len(train_idx)} for distillation / {len(val_idx)} held out).")
+
+    teacher = build_simple_cnn((224, 224, 3), len(classes))
+    teacher.load_weights(args.teacher)
+    student = build_compact_cnn((224, 224, 3), len(classes))
+
+    if args.report_only:
+        student.load_weights(args.output)
+    else:
+        train_gen = ThyroidDataGenerator([image_paths[i] for i in train_idx], [labels[i] for i in train_idx],
+                                         batch_size=args.batch_size, shuffle=True)
+        distill(teacher, student, train_gen, args.epochs, args.temperature, args.alpha)
+        # Weights only; the backend rebuilds the student with build_compact_cnn()
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        student.save_weights(args.output)
+        print(f"Student saved to {args.output}")
+
+    # Note the teacher itself is trained on every image, so its accuracy here is optimistic
+    images, kept = load_images([image_paths[i] for i in val_idx])
+    report = parity_report(teacher, student, images, [labels[val_idx[i]] for i in kept], args.teacher, args.output)
+    print_report(report)
+    os.makedirs(os.path.dirname(args.report) or '.', exist_ok=True)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
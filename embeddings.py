@@ -0,0 +1,169 @@
+import argparse
+import os
+import threading
+import cv2
+import numpy as np
+import tensorflow as tf
+
+# Similar-case retrieval. The penultimate Dense(128) activations of the classifier
+# are used as an image embedding; the labelled dataset is embedded once into a compact
+# float16 matrix and searched with a single vectorised cosine-similarity product.
+
+DEFAULT_INDEX_PATH = os.path.join('models', 'embedding_index.npz')
+
+
+def embedding_layer(model):
+    """The last Dense layer before the softmax output (Dense(128) in both served models)."""
+    dense = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Dense)]
+    if len(dense) < 2:
+        raise ValueError("Model has no hidden Dense layer to take embeddings from")
+    return dense[-2]
+
+
+def build_embedding_model(model):
+    """Model returning (embedding, class probabilities) from one forward pass."""
+    return tf.keras.models.Model(model.inputs, [embedding_layer(model).output, model.output])
+
+
+class EmbeddingIndex:
+    """L2-normalised float16 vectors with exact top-k cosine search; grows in place."""
+
+    def __init__(self, dim, capacity=256):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float16)
+        self._size = 0
+        self.paths = []
+        self.labels = []
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, path):
+        return path in self._known
+
+    @staticmethod
+    def _normalise(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, vectors.shape[-1])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, vectors, paths, labels):
+        vectors = self._normalise(np.asarray(vectors))
+        with self._lock:
+            needed = self._size + len(vectors)
+            if needed > len(self._vectors):
+                # Amortised doubling so incremental adds stay cheap
+                grown = np.zeros((max(needed, 2 * len(self._vectors)), self.dim), dtype=np.float16)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+            self._vectors[self._size:needed] = vectors
+            self._size = needed
+            self.paths.extend(paths)
+            self.labels.extend(int(l) for l in labels)
+            self._known.update(paths)
+
+    def search(self, vector, k=5):
+        """Return [(path, label, cosine similarity)] for the k nearest stored vectors."""
+        query = self._normalise(np.asarray(vector))[0]
+        with self._lock:
+            n = self._size
+            if n == 0:
+                return []
+            scores = self._vectors[:n].astype(np.float32) @ query
+            paths, labels = self.paths[:n], self.labels[:n]
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(paths[i], labels[i], float(scores[i])) for i in top]
+
+    def save(self, path):
+        with self._lock:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            np.savez_compressed(path, vectors=self._vectors[:self._size],
+                                paths=np.array(self.paths), labels=np.array(self.labels, dtype=np.int32))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        vectors = data['vectors']
+        index = cls(vectors.shape[1], capacity=max(len(vectors), 1))
+        index._vectors[:len(vectors)] = vectors
+        index._size = len(vectors)
+        index.paths = [str(p) for p in data['paths']]
+        index.labels = [int(l) for l in data['labels']]
+        index._known = set(index.paths)
+        return index
+
+
+def embed_images(embedding_model, image_paths, batch_size=32):
+    """Embed image files in batches. Unreadable files are skipped; returns (vectors, kept paths)."""
+    vectors, kept = [], []
+    for start in range(0, len(image_paths), batch_size):
+        batch, batch_paths = [], []
+        for path in image_paths[start:start + batch_size]:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            batch.append(cv2.resize(img, (224, 224)) / 255.0)
+            batch_paths.append(path)
+        if batch:
+            emb, _ = embedding_model(np.asarray(batch, dtype=np.float32), training=False)
+            vectors.append(np.asarray(emb))
+            kept += batch_paths
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32), kept
+    return np.concatenate(vectors), kept
+
+
+def update_index(index, embedding_model, rel_paths, labels, data_dir='', batch_size=32):
+    """
+    Embed only the images not already in the index. Paths are stored relative to
+    `data_dir` (e.g. 'Benign/127_1.jpg'). Returns the number added.
+    """
+    new = [(p, l) for p, l in zip(rel_paths, labels) if p not in index]
+    if not new:
+        return 0
+    label_of = dict(new)
+    vectors, kept = embed_images(embedding_model, [os.path.join(data_dir, p) for p, _ in new], batch_size)
+    if kept:
+        kept = [os.path.relpath(p, data_dir).replace(os.sep, '/') if data_dir else p for p in kept]
+        index.add(vectors, kept, [label_of[p] for p in kept])
+    return len(kept)
+
+
+if __name__ == '__main__':
+    from train import MODEL_VARIANTS
+    from dataset.data_loader import load_data_paths
+
+    parser = argparse.ArgumentParser(description="Build or update the similar-case embedding index")
+    parser.add_argument('--data-dir', default='dataset')
+    parser.add_argument('--model', choices=sorted(MODEL_VARIANTS), default='cnn')
+    parser.add_argument('--weights', help="Default: the model's weights file")
+    parser.add_argument('--index', help=f"Default: {DEFAULT_INDEX_PATH} (embedding_index_<model>.npz for other models)")
+    parser.add_argument('--rebuild', action='store_true', help="Start from an empty index")
+    args = parser.parse_args()
+    build_model, default_weights = MODEL_VARIANTS[args.model]
+    if not args.index:
+        args.index = DEFAULT_INDEX_PATH if args.model == 'cnn' else os.path.join('models', f'embedding_index_{args.model}.npz')
+
+    images, labels, classes = load_data_paths(args.data_dir)
+    if not images:
+        print("No images found!")
+        exit()
+
+    model = build_model((224, 224, 3), len(classes))
+    model.load_weights(args.weights or default_weights)
+    embedding_model = build_embedding_model(model)
+
+    if os.path.exists(args.index) and not args.rebuild:
+        index = EmbeddingIndex.load(args.index)
+        print(f"Loaded index with {len(index)} images")
+    else:
+        index = EmbeddingIndex(embedding_layer(model).units)
+
+    rel_paths = [os.path.relpath(p, args.data_dir).replace(os.sep, '/') for p in images]
+    added = update_index(index, embedding_model, rel_paths, labels, args.data_dir)
+    index.save(args.index)
+    print(f"Added {added} images, index now holds {len(index)} -> {args.index}")
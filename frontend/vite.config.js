@@ -12,10 +12,15 @@ export default defineConfig({
     allowedHosts: ['modesto-nongenerating-painedly.ngrok-free.dev'],
     proxy: {
       '/predict': 'http://localhost:5000',
+      '/predict_study': 'http://localhost:5000',
       '/generate_report': 'http://localhost:5000',
+      '/generate_batch_report': 'http://localhost:5000',
+      '/batch_reports': 'http://localhost:5000',
       '/uploads': 'http://localhost:5000',
       '/results': 'http://localhost:5000',
-      '/health': 'http://localhost:5000'
+      '/health': 'http://localhost:5000',
+      '/similar': 'http://localhost:5000',
+      '/dataset': 'http://localhost:5000'
     }
   }
 })
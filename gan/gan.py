@@ -1,60 +1,116 @@
 import tensorflow as tf
 from tensorflow.keras import layers
+import argparse
+import math
 import os
 import time
 
+LATENT_DIM = 100
+BASE_SIZE = 7  # generator starts from a 7x7 feature map and doubles it until image_size
+
+
+def _num_doublings(image_size):
+    n = math.log2(image_size / BASE_SIZE)
+    if n < 1 or not n.is_integer():
+        raise ValueError(f"image_size must be {BASE_SIZE} * 2^n (e.g. 28, 56, 112, 224), got {image_size}")
+    return int(n)
+
+
+def make_generator_model(image_size=224, latent_dim=LATENT_DIM):
+    n_up = _num_doublings(image_size)
 
-def make_generator_model():
     model = tf.keras.Sequential()
-    model.add(layers.Dense(7*7*256, use_bias=False, input_shape=(100,)))
+    model.add(layers.Input(shape=(latent_dim,)))
+    model.add(layers.Dense(BASE_SIZE*BASE_SIZE*256, use_bias=False))
     model.add(layers.BatchNormalization())
     model.add(layers.LeakyReLU())
 
-    model.add(layers.Reshape((7, 7, 256)))
-    assert model.output_shape == (None, 7, 7, 256)
+    model.add(layers.Reshape((BASE_SIZE, BASE_SIZE, 256)))
 
     model.add(layers.Conv2DTranspose(128, (5, 5), strides=(1, 1), padding='same', use_bias=False))
     model.add(layers.BatchNormalization())
     model.add(layers.LeakyReLU())
 
-    model.add(layers.Conv2DTranspose(64, (5, 5), strides=(2, 2), padding='same', use_bias=False))
-    model.add(layers.BatchNormalization())
-    model.add(layers.LeakyReLU())
+    # One stride-2 block per doubling: 7 -> 14 -> ... -> image_size, halving filters as we go
+    filters = 128
+    for _ in range(n_up - 1):
+        filters = max(filters // 2, 16)
+        model.add(layers.Conv2DTranspose(filters, (5, 5), strides=(2, 2), padding='same', use_bias=False))
+        model.add(layers.BatchNormalization())
+        model.add(layers.LeakyReLU())
 
     model.add(layers.Conv2DTranspose(3, (5, 5), strides=(2, 2), padding='same', use_bias=False, activation='tanh'))
-    
-    # Output: (28, 28, 1) -> adjust layers for 224x224 or target size
-    # For 224x224, we need more upsampling
+    assert model.output_shape == (None, image_size, image_size, 3)
     return model
 
-def make_discriminator_model():
-    model = tf.keras.Sequential()
-    model.add(layers.Conv2D(64, (5, 5), strides=(2, 2), padding='same', input_shape=[28, 28, 3])) # Adjust shape
-    model.add(layers.LeakyReLU())
-    model.add(layers.Dropout(0.3))
 
-    model.add(layers.Conv2D(128, (5, 5), strides=(2, 2), padding='same'))
-    model.add(layers.LeakyReLU())
-    model.add(layers.Dropout(0.3))
+def make_discriminator_model(image_size=224):
+    n_down = _num_doublings(image_size)
+
+    model = tf.keras.Sequential()
+    model.add(layers.Input(shape=(image_size, image_size, 3)))
+    # Stride-2 blocks back down to 7x7 so the Dense head stays small at any resolution
+    for i in range(n_down):
+        model.add(layers.Conv2D(min(64 * 2 ** i, 256), (5, 5), strides=(2, 2), padding='same'))
+        model.add(layers.LeakyReLU())
+        model.add(layers.Dropout(0.3))
 
     model.add(layers.Flatten())
     model.add(layers.Dense(1))
 
     return model
 
-def train_gan(dataset, epochs):
+
+def make_dataset(image_paths, image_size=224, batch_size=16, cache=True):
+    """
+    Parallel, cached, prefetching input pipeline. Images are scaled to [-1, 1] to match the
+    generator's tanh output. `cache` may be True (memory) or a file path for large sets.
+    """
+    def load_image(path):
+        img = tf.io.read_file(path)
+        img = tf.io.decode_image(img, channels=3, expand_animations=False)
+        img = tf.image.resize(img, [image_size, image_size])
+        img = (tf.cast(img, tf.float32) - 127.5) / 127.5
+        img.set_shape([image_size, image_size, 3])
+        return img
+
+    dataset = tf.data.Dataset.from_tensor_slices(image_paths)
+    dataset = dataset.map(load_image, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    if cache:
+        # Decode/resize once; later epochs read straight from the cache
+        dataset = dataset.cache() if cache is True else dataset.cache(cache)
+    dataset = dataset.shuffle(min(len(image_paths), 1000), reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def train_gan(dataset, epochs, image_size=224, latent_dim=LATENT_DIM, checkpoint_dir=None,
+              checkpoint_every=5, export_path=None, jit_compile=True):
+    """Train a DCGAN on `dataset` (batches in [-1, 1]) and return the generator."""
+    # Loss objects are created once, not per step
     cross_entropy = tf.keras.losses.BinaryCrossentropy(from_logits=True)
-    generator = make_generator_model()
-    discriminator = make_discriminator_model()
-    
+    generator = make_generator_model(image_size, latent_dim)
+    discriminator = make_discriminator_model(image_size)
+
     generator_optimizer = tf.keras.optimizers.Adam(1e-4)
     discriminator_optimizer = tf.keras.optimizers.Adam(1e-4)
-    
 
-    
-    @tf.function
+    manager = None
+    if checkpoint_dir:
+        checkpoint = tf.train.Checkpoint(
+            generator=generator,
+            discriminator=discriminator,
+            generator_optimizer=generator_optimizer,
+            discriminator_optimizer=discriminator_optimizer,
+        )
+        manager = tf.train.CheckpointManager(checkpoint, checkpoint_dir, max_to_keep=3)
+        if manager.latest_checkpoint:
+            checkpoint.restore(manager.latest_checkpoint)
+            print(f"Resumed from {manager.latest_checkpoint}")
+
+    # XLA-compiled step; the noise batch follows the real batch so a ragged last batch is fine
+    @tf.function(jit_compile=jit_compile, reduce_retracing=True)
     def train_step(images):
-        noise = tf.random.normal([BATCH_SIZE, 100])
+        noise = tf.random.normal([tf.shape(images)[0], latent_dim])
 
         with tf.GradientTape() as gen_tape, tf.GradientTape() as disc_tape:
             generated_images = generator(noise, training=True)
@@ -62,53 +118,70 @@ def train_gan(dataset, epochs):
             real_output = discriminator(images, training=True)
             fake_output = discriminator(generated_images, training=True)
 
-            gen_loss = tf.keras.losses.BinaryCrossentropy(from_logits=True)(tf.ones_like(fake_output), fake_output)
-            disc_loss = tf.keras.losses.BinaryCrossentropy(from_logits=True)(tf.ones_like(real_output), real_output) + \
-                        tf.keras.losses.BinaryCrossentropy(from_logits=True)(tf.zeros_like(fake_output), fake_output)
+            gen_loss = cross_entropy(tf.ones_like(fake_output), fake_output)
+            disc_loss = cross_entropy(tf.ones_like(real_output), real_output) + \
+                        cross_entropy(tf.zeros_like(fake_output), fake_output)
 
         gradients_of_generator = gen_tape.gradient(gen_loss, generator.trainable_variables)
         gradients_of_discriminator = disc_tape.gradient(disc_loss, discriminator.trainable_variables)
 
         generator_optimizer.apply_gradients(zip(gradients_of_generator, generator.trainable_variables))
         discriminator_optimizer.apply_gradients(zip(gradients_of_discriminator, discriminator.trainable_variables))
+        return gen_loss, disc_loss
 
-    print(f"Training GAN for {epochs} epochs...")
+    print(f"Training GAN at {image_size}x{image_size} for {epochs} epochs...")
     for epoch in range(epochs):
         start = time.time()
         for image_batch in dataset:
-            train_step(image_batch)
-        print(f'Time for epoch {epoch + 1} is {time.time()-start} sec')
+            gen_loss, disc_loss = train_step(image_batch)
+        print(f'Epoch {epoch + 1}: {time.time()-start:.1f} sec, gen_loss={float(gen_loss):.4f}, disc_loss={float(disc_loss):.4f}')
+
+        if manager and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == epochs):
+            print(f"Checkpoint saved: {manager.save()}")
+
+    if export_path:
+        os.makedirs(os.path.dirname(export_path) or '.', exist_ok=True)
+        generator.save(export_path)
+        print(f"Generator exported to {export_path}")
+    return generator
+
 
 if __name__ == '__main__':
-    # Load real images for GAN
+    parser = argparse.ArgumentParser(description="Train a DCGAN on one class folder of the dataset")
     # Training on Papillary Thyroid Carcinoma for demo
-    data_dir = "dataset/Papillary Thyroid Carcinoma" 
+    parser.add_argument('--class-name', default='Papillary Thyroid Carcinoma')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=2) # Short run
+    parser.add_argument('--no-xla', action='store_true', help="Disable XLA compilation of the train step")
+    parser.add_argument('--cache-file', help="Cache decoded images on disk instead of in memory")
+    args = parser.parse_args()
+
+    # Load real images for GAN
+    data_dir = os.path.join("dataset", args.class_name)
     if not os.path.exists(data_dir):
         # Fallback to dataset root if specific folder missing
         data_dir = "dataset"
-        
+
     images = []
     # Collect images
     for root, dirs, files in os.walk(data_dir):
         for file in files:
-             if file.endswith(('.jpg','.png')):
+             if file.lower().endswith(('.jpg', '.jpeg', '.png')):
                  images.append(os.path.join(root, file))
-    
+
     if not images:
         print("No images found for GAN training")
         exit()
-        
-    # Preprocess
-    def load_image(path):
-        img = tf.io.read_file(path)
-        img = tf.image.decode_jpeg(img, channels=3)
-        img = tf.image.resize(img, [28, 28]) # Resize to match GAN output
-        img = (tf.cast(img, tf.float32) - 127.5) / 127.5
-        return img
 
-    BATCH_SIZE = 16
-    train_dataset = tf.data.Dataset.from_tensor_slices(images).map(load_image).shuffle(1000).batch(BATCH_SIZE)
-    
-    train_gan(train_dataset, epochs=2) # Short run
+    slug = args.class_name.lower().replace(' ', '_')
+    train_dataset = make_dataset(images, args.image_size, args.batch_size, cache=args.cache_file or True)
+    train_gan(
+        train_dataset,
+        epochs=args.epochs,
+        image_size=args.image_size,
+        checkpoint_dir=os.path.join('models', 'gan_checkpoints', slug),
+        export_path=os.path.join('models', f'gan_generator_{slug}.h5'),
+        jit_compile=not args.no_xla,
+    )
     print("GAN Training Complete")
-
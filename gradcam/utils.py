@@ -42,9 +42,8 @@ def make_gradcam_heatmap(img_array, model, last_conv_layer_name="conv5_block3_ou
     heatmap = tf.maximum(heatmap, 0) / (tf.math.reduce_max(heatmap) + 1e-10) # Avoid div by zero
     return heatmap.numpy()
 
-def save_and_display_gradcam(img_path, heatmap, cam_path="cam.jpg", alpha=0.4):
-    # Load the original image
-    img = cv2.imread(img_path)
+def overlay_gradcam(img, heatmap, alpha=0.4):
+    # Works on an already-decoded BGR image so callers can skip a disk round-trip
     img = cv2.resize(img, (224, 224)) # Resize to match model input
 
     # Resize heatmap to match image dimensions
@@ -58,8 +57,12 @@ def save_and_display_gradcam(img_path, heatmap, cam_path="cam.jpg", alpha=0.4):
 
     # Superimpose the heatmap on original image using addWeighted
     # alpha=0.6 for original, beta=0.4 for heatmap (Adjust as needed)
-    superimposed_img = cv2.addWeighted(img, 0.6, jet, 0.4, 0)
+    return cv2.addWeighted(img, 0.6, jet, 0.4, 0)
+
+def save_and_display_gradcam(img_path, heatmap, cam_path="cam.jpg", alpha=0.4):
+    # Load the original image
+    img = cv2.imread(img_path)
+    superimposed_img = overlay_gradcam(img, heatmap, alpha)
     
     cv2.imwrite(cam_path, superimposed_img)
     return cam_path
-
@@ -28,6 +28,27 @@ SUBTYPE_WEIGHTS = [0.80, 0.10, 0.05, 0.05] # Probability distribution based on r
 def get_xml_files(directory):
     return [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.xml')]
 
+ROI_PADDING = 30
+
+def parse_roi_points(svg_text):
+    """First annotated polygon of a DDTI <svg> element as an (N, 2) int array, or None."""
+    # SVG format in DDTI is a JSON string of points
+    svg_json = ast.literal_eval(svg_text)
+    points = svg_json[0].get('points')
+    if not points:
+        return None
+    return np.array([[p['x'], p['y']] for p in points], dtype=np.int32)
+
+def roi_box(pts, img_shape, padding=ROI_PADDING):
+    """Bounding box + padding of a polygon, clipped to the image: (x1, y1, x2, y2)."""
+    x, y, w, h = cv2.boundingRect(pts)
+    h_img, w_img = img_shape[:2]
+    x1 = max(0, x - padding)
+    y1 = max(0, y - padding)
+    x2 = min(w_img, x + w + padding)
+    y2 = min(h_img, y + h + padding)
+    return x1, y1, x2, y2
+
 def parse_xml_and_process(xml_path):
     try:
         tree = ET.parse(xml_path)
@@ -82,22 +103,11 @@ def parse_xml_and_process(xml_path):
             
             if svg_elem is not None and svg_elem.text:
                 try:
-                    # SVG format in DDTI is a JSON string of points
-                    svg_json = ast.literal_eval(svg_elem.text)
-                    points = svg_json[0].get('points')
+                    pts = parse_roi_points(svg_elem.text)
                     
-                    if points:
-                        pts = np.array([[p['x'], p['y']] for p in points], dtype=np.int32)
-                        
+                    if pts is not None:
                         # Bounding Box + Padding
-                        x, y, w, h = cv2.boundingRect(pts)
-                        padding = 30
-                        
-                        h_img, w_img = img.shape[:2]
-                        x1 = max(0, x - padding)
-                        y1 = max(0, y - padding)
-                        x2 = min(w_img, x + w + padding)
-                        y2 = min(h_img, y + h + padding)
+                        x1, y1, x2, y2 = roi_box(pts, img.shape)
                         
                         cropped = img[y1:y2, x1:x2]
                         
@@ -11,4 +11,7 @@ npm install
 npm run build
 cd ..
 
+echo "--- Precompressing Frontend Assets ---"
+python backend/static_assets.py
+
 echo "--- Build Complete ---"
@@ -1,60 +1,277 @@
-
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import hashlib
+import multiprocessing
+import threading
 import os
+import zipfile
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # batch PDFs are then drawn on one canvas in this process
+    PdfReader = PdfWriter = None
+
+# Default location of uploads/results when no loader is supplied (same layout as backend/app.py)
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend', 'public')
+
+# Layout template shared by every report (coordinates in PDF points)
+LAYOUT = {
+    'page_size': letter,
+    'left': 100,
+    'title_y': 750,
+    'rule': (100, 740, 500, 740),
+    'body_y': 700,
+    'line_height': 20,
+    'image_size': 200,
+    'image_gap': 220,
+    'heatmap_x': 320,
+}
+TITLE_FONT = ("Helvetica-Bold", 20)
+HEADING_FONT = ("Helvetica-Bold", 14)
+BODY_FONT = ("Helvetica", 12)
+
+# Decoded images are reused across reports, keyed by content hash
+IMAGE_CACHE_SIZE = 64
+_image_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+
+def get_image_reader(data):
+    """Return a (cached) ImageReader for encoded image bytes."""
+    key = hashlib.sha1(data).hexdigest()
+    with _image_cache_lock:
+        reader = _image_cache.get(key)
+        if reader is not None:
+            _image_cache.move_to_end(key)
+            return reader
+
+    reader = ImageReader(BytesIO(data))
+    with _image_cache_lock:
+        _image_cache[key] = reader
+        while len(_image_cache) > IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return reader
+
+
+def load_public_image(url):
+    # URL like /uploads/filename -> frontend/public/uploads/filename
+    local_path = os.path.normpath(os.path.join(PUBLIC_DIR, url.lstrip('/')))
+    if not local_path.startswith(PUBLIC_DIR) or not os.path.isfile(local_path):
+        return None
+    with open(local_path, 'rb') as f:
+        return f.read()
+
+
+def _draw_header(c):
+    # Static part of the page is recorded once per document and re-used as a form
+    if not c.hasForm('report_header'):
+        c.beginForm('report_header')
+        c.setFont(*TITLE_FONT)
+        c.drawString(LAYOUT['left'], LAYOUT['title_y'], "Thyroid Cancer Detection Report")
+        c.line(*LAYOUT['rule'])
+        c.endForm()
+    c.doForm('report_header')
+
+
+def draw_report_page(c, patient_data, prediction_result, image_loader=load_public_image):
+    """Draw a single report page onto an open canvas."""
+    left = LAYOUT['left']
+    step = LAYOUT['line_height']
+    _draw_header(c)
 
-def create_report(file_path, patient_data, prediction_result):
-    c = canvas.Canvas(file_path, pagesize=letter)
-    width, height = letter
-    
-    # Title
-    c.setFont("Helvetica-Bold", 20)
-    c.drawString(100, 750, "Thyroid Cancer Detection Report")
-    
-    # Line
-    c.line(100, 740, 500, 740)
-    
     # Patient Data (Mock)
-    c.setFont("Helvetica", 12)
-    y = 700
-    c.drawString(100, y, f"Date: {patient_data.get('date', 'N/A')}")
-    y -= 20
-    
+    c.setFont(*BODY_FONT)
+    y = LAYOUT['body_y']
+    c.drawString(left, y, f"Date: {patient_data.get('date', 'N/A')}")
+    y -= step
+
     # Prediction Results
-    c.setFont("Helvetica-Bold", 14)
-    y -= 20
-    c.drawString(100, y, "Diagnosis Results:")
-    c.setFont("Helvetica", 12)
-    y -= 20
-    c.drawString(100, y, f"Classification: {prediction_result.get('result', 'Unknown')}")
-    y -= 20
-    c.drawString(100, y, f"Confidence: {prediction_result.get('confidence', 'N/A')}")
-    y -= 20
-    c.drawString(100, y, f"Recommendation: {prediction_result.get('recommendation', 'N/A')}")
-    
+    c.setFont(*HEADING_FONT)
+    y -= step
+    c.drawString(left, y, "Diagnosis Results:")
+    c.setFont(*BODY_FONT)
+    y -= step
+    c.drawString(left, y, f"Classification: {prediction_result.get('result', 'Unknown')}")
+    y -= step
+    c.drawString(left, y, f"Confidence: {prediction_result.get('confidence', 'N/A')}")
+    y -= step
+    c.drawString(left, y, f"Recommendation: {prediction_result.get('recommendation', 'N/A')}")
+
     # Images (if available)
-    y -= 220
+    y -= LAYOUT['image_gap']
+    size = LAYOUT['image_size']
     try:
         # Original Image
         orig_url = prediction_result.get('original_url')
-        if orig_url:
-            # Convert URL to local path (assuming running locally)
-            # URL like /uploads/filename -> frontend/public/uploads/filename
-            local_path = f"d:/Thyroid Cancer Detection/frontend/public{orig_url}"
-            if os.path.exists(local_path):
-                c.drawImage(local_path, 100, y, width=200, height=200, preserveAspectRatio=True)
-                c.drawString(100, y-20, "Original Ultrasound")
-        
+        data = image_loader(orig_url) if orig_url else None
+        if data:
+            c.drawImage(get_image_reader(data), left, y, width=size, height=size, preserveAspectRatio=True)
+            c.drawString(left, y-20, "Original Ultrasound")
+
         # Heatmap
         hm_url = prediction_result.get('heatmap_url')
-        if hm_url:
-            local_hm_path = f"d:/Thyroid Cancer Detection/frontend/public{hm_url}"
-            if os.path.exists(local_hm_path):
-                c.drawImage(local_hm_path, 320, y, width=200, height=200, preserveAspectRatio=True)
-                c.drawString(320, y-20, "Grad-CAM Heatmap")
+        data = image_loader(hm_url) if hm_url else None
+        if data:
+            c.drawImage(get_image_reader(data), LAYOUT['heatmap_x'], y, width=size, height=size, preserveAspectRatio=True)
+            c.drawString(LAYOUT['heatmap_x'], y-20, "Grad-CAM Heatmap")
     except Exception as e:
-        c.drawString(100, y-40, f"Error adding images: {str(e)}")
+        c.drawString(left, y-40, f"Error adding images: {str(e)}")
+
 
+def create_report(output, patient_data, prediction_result, image_loader=load_public_image):
+    """
+    Render a report to `output`, which may be a file path or a writable binary buffer.
+    `image_loader` maps an image URL (/uploads/..., /results/...) to encoded bytes or None.
+    """
+    c = canvas.Canvas(output, pagesize=LAYOUT['page_size'])
+    draw_report_page(c, patient_data, prediction_result, image_loader)
     c.save()
 
+
+def render_report(patient_data, prediction_result, image_loader=load_public_image):
+    """Render a report entirely in memory and return the PDF bytes."""
+    buffer = BytesIO()
+    create_report(buffer, patient_data, prediction_result, image_loader)
+    return buffer.getvalue()
+
+
+def _report_urls(reports):
+    urls = set()
+    for data in reports:
+        prediction = data.get('prediction') or {}
+        urls.update(u for u in (prediction.get('original_url'), prediction.get('heatmap_url')) if u)
+    return urls
+
+
+def _prefetch_images(reports, image_loader, max_workers):
+    # Fetch every distinct image once, in parallel (I/O bound, so threads are fine)
+    def fetch(url):
+        return url, image_loader(url) or None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(pool.map(fetch, _report_urls(reports)))
+
+
+def _render_chunk(items, images, combined):
+    """
+    Render [(index, payload)] with pre-fetched image bytes. Runs in a worker process, so it
+    only takes picklable data. Returns one multi-page PDF if `combined`, else [(index, pdf)].
+    """
+    loader = images.get
+    if not combined:
+        return [(i, render_report(data, data.get('prediction') or {}, loader)) for i, data in items]
+    buffer = BytesIO()
+    # reportlab stores identical images only once per document
+    c = canvas.Canvas(buffer, pagesize=LAYOUT['page_size'])
+    for _, data in items:
+        draw_report_page(c, data, data.get('prediction') or {}, loader)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+# Render processes are spawned once and reused across batches. fork is not safe here: the
+# backend calls this from a thread of a multi-threaded process, and a child forked while
+# another thread holds a lock (the image cache's, malloc's, TensorFlow's) would hang.
+# Under gunicorn the spawned workers only import this module; under `python backend/app.py`
+# they re-import the app once when the pool starts.
+_render_pools = {}
+_render_pools_lock = threading.Lock()
+
+
+def _render_pool(workers):
+    with _render_pools_lock:
+        pool = _render_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _render_pools[workers] = pool
+        return pool
+
+
+def _discard_render_pool(workers):
+    with _render_pools_lock:
+        pool = _render_pools.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_batch_report(reports, image_loader=load_public_image, output_format='pdf', max_workers=4, progress=None):
+    """
+    Render many reports at once. Each entry has the same shape as a /generate_report payload.
+    Returns the bytes of one combined PDF (one page per study) or, with output_format='zip',
+    a zip holding one PDF per study. `progress(done, total)` is called as studies complete.
+
+    Images are fetched once in the calling process. The studies are then split into
+    contiguous chunks and rendered by up to `max_workers` processes, capped at the CPU
+    count (reportlab is pure Python and holds the GIL, so threads don't help). For 'pdf'
+    the chunk PDFs are merged in order with pypdf. Without pypdf, or with a single
+    worker, everything renders in this process.
+    """
+    if output_format not in ('pdf', 'zip'):
+        raise ValueError(f"Unsupported batch format: {output_format}")
+
+    total = len(reports)
+    images = _prefetch_images(reports, image_loader, max_workers)
+    if progress:
+        progress(0, total)
+
+    combined = output_format == 'pdf'
+    items = list(enumerate(reports))
+    workers = min(max_workers, total, os.cpu_count() or 1)
+    if combined and PdfWriter is None:
+        workers = 1
+    # A few chunks per worker keeps progress moving and evens out uneven studies
+    n_chunks = 1 if workers <= 1 else min(total, workers * 4)
+    bounds = [round(k * total / n_chunks) for k in range(n_chunks + 1)]
+    chunks = [items[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    results = {}
+    done = 0
+    if workers <= 1:
+        for k, chunk in enumerate(chunks):
+            results[k] = _render_chunk(chunk, images, combined)
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+    else:
+        pool = _render_pool(workers)
+        try:
+            futures = {}
+            for k, chunk in enumerate(chunks):
+                # Each worker only receives the images its studies use
+                chunk_images = {u: images.get(u) for u in _report_urls(data for _, data in chunk)}
+                futures[pool.submit(_render_chunk, chunk, chunk_images, combined)] = k
+            for future in as_completed(futures):
+                k = futures[future]
+                results[k] = future.result()
+                done += len(chunks[k])
+                if progress:
+                    progress(done, total)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool for the next batch
+            _discard_render_pool(workers)
+            raise
+
+    buffer = BytesIO()
+    if combined:
+        if len(chunks) == 1:
+            return results[0]
+        writer = PdfWriter()
+        for k in range(len(chunks)):
+            writer.append(PdfReader(BytesIO(results[k])))
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    # PDFs are already compressed, so store them as-is
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for k in range(len(chunks)):
+            for i, pdf in results[k]:
+                # Index prefix keeps names unique and in submission order
+                name = f"{i + 1:03d}_report_{reports[i].get('id', 'study')}.pdf"
+                archive.writestr(os.path.basename(name), pdf)
+    return buffer.getvalue()
@@ -0,0 +1,208 @@
+import argparse
+import os
+import random
+import time
+import xml.etree.ElementTree as ET
+import cv2
+import numpy as np
+from tensorflow.keras import layers, models, losses
+
+from process_real_data import parse_roi_points, roi_box, ROI_PADDING
+
+# ROI localisation before classification. The classifier is trained on nodule crops
+# (DDTI polygon bounding box + 30 px, see process_real_data.py); this small box regressor,
+# trained on the same polygons, finds that region in a full ultrasound frame so
+# /predict can crop it instead of squashing the whole frame to 224x224.
+
+INPUT_SIZE = 128
+DEFAULT_DETECTOR_PATH = os.path.join('models', 'roi_detector.weights.h5')
+# A padded box covering most of the frame means the upload is already a crop; keep it whole
+MAX_CROP_FRACTION = 0.7
+
+
+def load_annotations(raw_dir):
+    """
+    (image paths, boxes) for every DDTI frame with a readable polygon. Boxes are the
+    unpadded polygon bounds (x1, y1, x2, y2) in pixels, one per frame.
+    """
+    paths, boxes = [], []
+    for name in sorted(os.listdir(raw_dir)):
+        if not name.endswith('.xml'):
+            continue
+        try:
+            root = ET.parse(os.path.join(raw_dir, name)).getroot()
+        except ET.ParseError:
+            continue
+        case_num = root.find('number').text
+        for mark in root.findall('mark'):
+            path = os.path.join(raw_dir, f"{case_num}_{mark.find('image').text}.jpg")
+            svg_elem = mark.find('svg')
+            if svg_elem is None or not svg_elem.text or not os.path.exists(path):
+                continue
+            try:
+                pts = parse_roi_points(svg_elem.text)
+            except (ValueError, SyntaxError):
+                continue  # a few DDTI polygons are truncated
+            if pts is None:
+                continue
+            x, y, w, h = cv2.boundingRect(pts)
+            paths.append(path)
+            boxes.append((x, y, x + w, y + h))
+    return paths, boxes
+
+
+def build_roi_detector(input_size=INPUT_SIZE):
+    """Separable-conv regressor for one normalised box (x1, y1, x2, y2) per frame."""
+    inputs = layers.Input(shape=(input_size, input_size, 3))
+    x = inputs
+    for filters in (16, 32, 64, 96, 128):
+        x = layers.SeparableConv2D(filters, (3, 3), padding='same', use_bias=False)(x)
+        x = layers.BatchNormalization()(x)
+        x = layers.ReLU()(x)
+        x = layers.MaxPooling2D((2, 2))(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(0.3)(x)
+    outputs = layers.Dense(4, activation='sigmoid')(x)
+
+    model = models.Model(inputs=inputs, outputs=outputs)
+    model.compile(optimizer='adam', loss=losses.Huber(delta=0.05))
+    return model
+
+
+def preprocess(img, input_size=INPUT_SIZE):
+    return cv2.resize(img, (input_size, input_size), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+
+def box_iou(a, b):
+    iw = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    ih = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def detect_roi(img, detector, padding=ROI_PADDING):
+    """Padded nodule box (x1, y1, x2, y2) in pixels for a BGR frame, or None if degenerate."""
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = np.asarray(detector(preprocess(img)[np.newaxis], training=False))[0]
+    corners = np.array([[x1 * w, y1 * h], [x2 * w, y2 * h]], dtype=np.int32)
+    if corners[1, 0] <= corners[0, 0] or corners[1, 1] <= corners[0, 1]:
+        return None
+    # Same padding/clipping as the training crops
+    return tuple(int(v) for v in roi_box(corners, img.shape, padding))
+
+
+def crop_roi(img, detector, max_fraction=MAX_CROP_FRACTION):
+    """Returns (image to classify, box or None). The frame is kept whole if no useful box is found."""
+    box = detect_roi(img, detector)
+    if box is None:
+        return img, None
+    x1, y1, x2, y2 = box
+    h, w = img.shape[:2]
+    if (x2 - x1) * (y2 - y1) > max_fraction * w * h:
+        return img, None
+    return img[y1:y2, x1:x2], box
+
+
+def train_detector(paths, boxes, epochs=60, batch_size=16, input_size=INPUT_SIZE):
+    X, Y = [], []
+    for path, (x1, y1, x2, y2) in zip(paths, boxes):
+        img = cv2.imread(path)
+        h, w = img.shape[:2]
+        X.append(preprocess(img, input_size))
+        Y.append([x1 / w, y1 / h, x2 / w, y2 / h])
+        # The padded training crop as well, so a pre-cropped upload maps to (almost) the whole image
+        px1, py1, px2, py2 = roi_box(np.array([[x1, y1], [x2, y2]], dtype=np.int32), img.shape)
+        cw, ch = px2 - px1, py2 - py1
+        X.append(preprocess(img[py1:py2, px1:px2], input_size))
+        Y.append([(x1 - px1) / cw, (y1 - py1) / ch, (x2 - px1) / cw, (y2 - py1) / ch])
+    X, Y = np.asarray(X), np.asarray(Y, dtype=np.float32)
+
+    detector = build_roi_detector(input_size)
+    rng = np.random.default_rng(0)
+    for epoch in range(epochs):
+        # Fresh flips / gain per epoch; a horizontal flip mirrors the box too
+        xa, ya = X.copy(), Y.copy()
+        flip = rng.random(len(xa)) < 0.5
+        xa[flip] = xa[flip, :, ::-1]
+        ya[flip] = np.stack([1 - Y[flip, 2], Y[flip, 1], 1 - Y[flip, 0], Y[flip, 3]], axis=1)
+        xa = np.clip(xa * rng.uniform(0.8, 1.2, (len(xa), 1, 1, 1)).astype(np.float32), 0.0, 1.0)
+        history = detector.fit(xa, ya, batch_size=batch_size, epochs=1, shuffle=True, verbose=0)
+        if (epoch + 1) % 10 == 0 or epoch + 1 == epochs:
+            print(f"Epoch {epoch + 1}/{epochs}: loss={history.history['loss'][-1]:.4f}")
+    return detector
+
+
+def evaluate(detector, paths, boxes, padding=ROI_PADDING):
+    """
+    Mean IoU of the padded predicted box against the padded annotation (the crop the
+    classifier was trained on), share of frames with IoU >= 0.5, ms per frame, and the
+    share of already-cropped images that crop_roi() correctly leaves whole.
+    """
+    ious, seconds, kept_whole = [], 0.0, 0
+    detect_roi(np.zeros((360, 560, 3), np.uint8), detector)  # warm-up
+    for path, (x1, y1, x2, y2) in zip(paths, boxes):
+        img = cv2.imread(path)
+        target = roi_box(np.array([[x1, y1], [x2, y2]], dtype=np.int32), img.shape, padding)
+        start = time.perf_counter()
+        box = detect_roi(img, detector, padding)
+        seconds += time.perf_counter() - start
+        ious.append(box_iou(box, target) if box else 0.0)
+        _, crop_box = crop_roi(img[target[1]:target[3], target[0]:target[2]], detector)
+        kept_whole += crop_box is None
+    ious = np.asarray(ious)
+    n = max(len(paths), 1)
+    return float(ious.mean()), float((ious >= 0.5).mean()), 1000 * seconds / n, kept_whole / n
+
+
+def split_by_case(paths, boxes, val_fraction, seed=0):
+    """Hold out whole cases so frames of one nodule never land on both sides."""
+    cases = sorted({os.path.basename(p).split('_')[0] for p in paths})
+    random.Random(seed).shuffle(cases)
+    val_cases = set(cases[:int(len(cases) * val_fraction)])
+    train, val = ([], []), ([], [])
+    for path, box in zip(paths, boxes):
+        side = val if os.path.basename(path).split('_')[0] in val_cases else train
+        side[0].append(path)
+        side[1].append(box)
+    return train, val
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train/evaluate the ROI detector on DDTI polygon annotations")
+    parser.add_argument('--raw-dir', default=os.path.join('dataset', 'raw'))
+    parser.add_argument('--output', default=DEFAULT_DETECTOR_PATH)
+    parser.add_argument('--epochs', type=int, default=60)
+    parser.add_argument('--val-fraction', type=float, default=0.2)
+    parser.add_argument('--eval-only', action='store_true', help="Evaluate existing weights on the held-out cases")
+    args = parser.parse_args()
+
+    paths, boxes = load_annotations(args.raw_dir)
+    if not paths:
+        print("No annotated frames found!")
+        exit()
+    (train_paths, train_boxes), (val_paths, val_boxes) = split_by_case(paths, boxes, args.val_fraction)
+    print(f"Found {len(paths)} annotated frames ({len(train_paths)} train / {len(val_paths)} held out).")
+
+    if args.eval_only:
+        detector = build_roi_detector()
+        detector.load_weights(args.output)
+    else:
+        detector = train_detector(train_paths, train_boxes, args.epochs)
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        detector.save_weights(args.output)
+        print(f"ROI detector saved to {args.output}")
+
+    if val_paths:
+        mean_iou, hit_rate, ms, kept_whole = evaluate(detector, val_paths, val_boxes)
+        # Reference: a fixed box over the central part of the frame
+        center = []
+        for path, (x1, y1, x2, y2) in zip(val_paths, val_boxes):
+            h, w = cv2.imread(path).shape[:2]
+            target = roi_box(np.array([[x1, y1], [x2, y2]], dtype=np.int32), (h, w))
+            center.append(box_iou((int(0.2 * w), int(0.1 * h), int(0.8 * w), int(0.8 * h)), target))
+        print(f"\n--- ROI Report ({len(val_paths)} held-out frames) ---")
+        print(f"{'method':<10}{'mean IoU':>10}{'IoU>=.5':>10}{'ms/frame':>10}")
+        print(f"{'detector':<10}{mean_iou:>10.3f}{hit_rate:>10.3f}{ms:>10.1f}")
+        print(f"{'center':<10}{np.mean(center):>10.3f}{np.mean(np.asarray(center) >= 0.5):>10.3f}{'-':>10}")
+        print(f"Pre-cropped images left uncropped: {kept_whole:.1%}")
@@ -0,0 +1,207 @@
+import argparse
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+import cv2
+import numpy as np
+from tensorflow.keras import layers, models
+
+from embeddings import build_embedding_model, embedding_layer
+
+# Study-level model: the per-frame CNN runs once per frame and its Dense(128)
+# embedding is cached by image hash; a small LSTM head classifies the sequence
+# of cached embeddings. Adding or reordering frames only re-runs the head.
+
+MAX_FRAMES = 8
+FRAME_NAME = re.compile(r'^(\d+)_(\d+)\.(jpg|jpeg|png)$', re.IGNORECASE)
+DEFAULT_HEAD_PATH = os.path.join('models', 'study_head.weights.h5')
+DEFAULT_CACHE_DIR = os.path.join('models', 'frame_cache')
+
+
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def weights_tag(weights_path):
+    """Short tag identifying a set of CNN weights; cached embeddings are only valid for one."""
+    if not weights_path or not os.path.exists(weights_path):
+        return 'untrained'
+    st = os.stat(weights_path)
+    return hashlib.sha1(f"{os.path.abspath(weights_path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:12]
+
+
+class FrameFeatureCache:
+    """
+    Per-frame embeddings keyed by image hash: an in-memory LRU in front of
+    <cache_dir>/<weights tag>/ab/<hash>.npy files (float16). With cache_dir=None
+    nothing is written to disk and only the LRU is used.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, tag='untrained', memory_size=4096):
+        self.dir = os.path.join(cache_dir, tag) if cache_dir else None
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.dir, key[:2], f"{key}.npy")
+
+    def get(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+        if self.dir and os.path.exists(self._path(key)):
+            vector = np.load(self._path(key))
+            self._remember(key, vector)
+            return vector
+        return None
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float16)
+        self._remember(key, vector)
+        if self.dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.save(path, vector)
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def embed(self, frames, embedding_model, batch_size=32, preprocess=None):
+        """
+        Embeddings for a list of encoded frames (bytes). Only cache misses go through
+        the CNN, in batches. `preprocess` (e.g. the backend's ROI crop) is applied to each
+        decoded frame; the cache tag must change with it. Returns a float32 array (n_frames, dim).
+        """
+        keys = [image_hash(data) for data in frames]
+        vectors = [self.get(k) for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            batch, kept = [], []
+            for i in chunk:
+                img = cv2.imdecode(np.frombuffer(frames[i], np.uint8), cv2.IMREAD_COLOR)
+                if img is None:
+                    raise ValueError(f"Frame {i} is not a readable image")
+                if preprocess is not None:
+                    img = preprocess(img)
+                batch.append(cv2.resize(img, (224, 224)) / 255.0)
+                kept.append(i)
+            emb, _ = embedding_model(np.asarray(batch, dtype=np.float32), training=False)
+            for i, vector in zip(kept, np.asarray(emb)):
+                self.put(keys[i], vector)
+                vectors[i] = vector
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def pad_sequences(sequences, max_frames=MAX_FRAMES):
+    """
+    Stack (n_i, dim) sequences into (batch, max_frames, dim) plus a (batch, max_frames)
+    boolean mask of the real frames. The mask is explicit because a real frame can embed
+    to all zeros (ReLU), so zero rows can't stand for padding.
+    """
+    dim = sequences[0].shape[1]
+    out = np.zeros((len(sequences), max_frames, dim), dtype=np.float32)
+    mask = np.zeros((len(sequences), max_frames), dtype=bool)
+    for i, seq in enumerate(sequences):
+        seq = seq[:max_frames]
+        out[i, :len(seq)] = seq
+        mask[i, :len(seq)] = True
+    return out, mask
+
+
+def build_sequence_head(embedding_dim=128, num_classes=5, max_frames=MAX_FRAMES):
+    """Lightweight LSTM over per-frame embeddings; inputs are [embeddings, frame mask]."""
+    inputs = layers.Input(shape=(max_frames, embedding_dim))
+    frame_mask = layers.Input(shape=(max_frames,), dtype='bool')
+    x = layers.LSTM(64)(inputs, mask=frame_mask)
+    x = layers.Dropout(0.3)(x)
+    outputs = layers.Dense(num_classes, activation='softmax')(x)
+
+    model = models.Model(inputs=[inputs, frame_mask], outputs=outputs)
+    model.compile(optimizer='adam',
+                  loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def group_studies(image_paths, labels):
+    """
+    Group DDTI frames named {case}_{idx}.jpg into studies ordered by frame index.
+    Returns a list of (case id, [paths], label).
+    """
+    frames = defaultdict(list)
+    case_label = {}
+    for path, label in zip(image_paths, labels):
+        match = FRAME_NAME.match(os.path.basename(path))
+        if not match:
+            continue
+        case = match.group(1)
+        frames[case].append((int(match.group(2)), path))
+        case_label[case] = label
+    return [(case, [p for _, p in sorted(frames[case])], case_label[case]) for case in sorted(frames, key=int)]
+
+
+def predict_study(frames, embedding_model, head, cache, max_frames=MAX_FRAMES, preprocess=None):
+    """Class probabilities for one study given its encoded frames in order."""
+    sequence = cache.embed(frames, embedding_model, preprocess=preprocess)
+    X, mask = pad_sequences([sequence], max_frames)
+    return np.asarray(head([X, mask], training=False))[0]
+
+
+if __name__ == '__main__':
+    from train import MODEL_VARIANTS
+    from dataset.data_loader import load_data_paths
+
+    parser = argparse.ArgumentParser(description="Train the study-level sequence head on cached frame embeddings")
+    parser.add_argument('--data-dir', default='dataset')
+    parser.add_argument('--model', choices=sorted(MODEL_VARIANTS), default='cnn')
+    parser.add_argument('--weights', help="Default: the model's weights file")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--output', help=f"Default: {DEFAULT_HEAD_PATH} (study_head_<model>.weights.h5 for other models)")
+    parser.add_argument('--epochs', type=int, default=50)
+    args = parser.parse_args()
+    build_model, default_weights = MODEL_VARIANTS[args.model]
+    args.weights = args.weights or default_weights
+    if not args.output:
+        args.output = DEFAULT_HEAD_PATH if args.model == 'cnn' else os.path.join('models', f'study_head_{args.model}.weights.h5')
+
+    images, labels, classes = load_data_paths(args.data_dir)
+    studies = group_studies(images, labels)
+    if not studies:
+        print("No studies found!")
+        exit()
+    print(f"Found {len(studies)} studies ({sum(len(p) for _, p, _ in studies)} frames).")
+
+    cnn = build_model((224, 224, 3), len(classes))
+    cnn.load_weights(args.weights)
+    embedding_model = build_embedding_model(cnn)
+    cache = FrameFeatureCache(args.cache_dir, weights_tag(args.weights))
+
+    # CNN runs once per frame; re-running this script only embeds new frames
+    sequences = []
+    for _, paths, _ in studies:
+        frames = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                frames.append(f.read())
+        sequences.append(cache.embed(frames, embedding_model))
+
+    X, mask = pad_sequences(sequences)
+    y = np.array([label for _, _, label in studies])
+    head = build_sequence_head(embedding_layer(cnn).units, len(classes))
+    head.fit([X, mask], y, epochs=args.epochs, batch_size=16, shuffle=True)
+
+    # Weights only; the head is rebuilt with build_sequence_head() when loading
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    head.save_weights(args.output)
+    print(f"Study head saved to {args.output}")
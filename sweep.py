@@ -0,0 +1,268 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import multiprocessing as mp
+import os
+import time
+import cv2
+import numpy as np
+
+# Cross-validation / hyperparameter sweep for build_simple_cnn. Every (trial, fold)
+# pair is one task on a local process pool: the dataset is decoded and resized once
+# into a uint8 .npy that all workers memory-map read-only, each worker pins its TF
+# thread pools so N workers don't oversubscribe the cores, and a shared median rule
+# stops trials that fall behind. Results are written as a ranked CSV.
+#
+# TensorFlow is only imported inside the workers (after the thread settings) and in
+# the parent via dataset.data_loader, never at the top of this module.
+
+DEFAULT_CACHE_DIR = os.path.join('models', 'sweep_cache')
+DEFAULT_GRID = {
+    'learning_rate': [1e-3, 3e-4],
+    'dropout': [0.3, 0.5],
+    'dense_units': [64, 128],
+}
+
+
+def parse_value(text):
+    """'1e-3' -> 0.001, '64' -> 64, '16/32/64' -> (16, 32, 64) (for `filters`)."""
+    if '/' in text:
+        return tuple(parse_value(part) for part in text.split('/'))
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_grid(specs):
+    """['dropout=0.3,0.5', ...] -> {'dropout': [0.3, 0.5], ...}; DEFAULT_GRID if empty."""
+    if not specs:
+        return dict(DEFAULT_GRID)
+    grid = {}
+    for spec in specs:
+        name, values = spec.split('=', 1)
+        grid[name.strip()] = [parse_value(v.strip()) for v in values.split(',')]
+    return grid
+
+
+def expand_grid(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def prepare_dataset(image_paths, labels, cache_dir=DEFAULT_CACHE_DIR, image_size=224):
+    """
+    Decode + resize every image once into <cache_dir>/<key>_images.npy (uint8, BGR like
+    cv2.imread) and <key>_labels.npy. The key covers the file list, sizes, mtimes and the
+    image size, so the cache is reused until the dataset changes. Unreadable images get
+    label -1. Returns (images path, labels path).
+    """
+    digest = hashlib.sha1(str(image_size).encode())
+    for path, label in zip(image_paths, labels):
+        st = os.stat(path)
+        digest.update(f"{path}:{label}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    key = digest.hexdigest()[:16]
+    images_path = os.path.join(cache_dir, f"{key}_images.npy")
+    labels_path = os.path.join(cache_dir, f"{key}_labels.npy")
+    if os.path.exists(images_path) and os.path.exists(labels_path):
+        print(f"Using cached dataset {images_path}")
+        return images_path, labels_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = images_path + '.tmp'
+    # Written straight into a memory-mapped .npy, so the parent never holds the whole set
+    images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(image_paths), image_size, image_size, 3))
+    y = np.asarray(labels, dtype=np.int32).copy()
+    for i, path in enumerate(image_paths):
+        img = cv2.imread(path)
+        if img is None:
+            y[i] = -1
+            continue
+        images[i] = cv2.resize(img, (image_size, image_size))
+    images.flush()
+    del images
+    os.replace(tmp_path, images_path)
+    np.save(labels_path, y)
+    print(f"Cached {len(image_paths)} images -> {images_path}")
+    return images_path, labels_path
+
+
+# --- worker side ----------------------------------------------------------
+_worker = {}
+
+
+def init_worker(images_path, labels_path, threads, shared):
+    # Must run before TensorFlow creates its thread pools in this process
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    _worker['images'] = np.load(images_path, mmap_mode='r')
+    _worker['labels'] = np.load(labels_path)
+    _worker['history'], _worker['pruned'], _worker['lock'] = shared
+
+
+def run_task(task):
+    """Train one fold of one trial. Returns a result row (status complete / pruned / skipped)."""
+    import tensorflow as tf
+    from train import build_simple_cnn
+    from dataset.data_loader import ArrayDataGenerator
+
+    trial, fold, params, train_idx, val_idx, cfg = task
+    history, pruned, lock = _worker['history'], _worker['pruned'], _worker['lock']
+    row = {'trial': trial, 'fold': fold, 'params': params, 'status': 'complete',
+           'val_accuracy': None, 'val_loss': None, 'epochs': 0, 'seconds': 0.0}
+    if trial in pruned:
+        # Another fold of this trial was already stopped; don't spend time on the rest
+        row['status'] = 'skipped'
+        return row
+
+    images, labels = _worker['images'], _worker['labels']
+    size = images.shape[1]
+    model = build_simple_cnn((size, size, 3), cfg['num_classes'], **params)
+    train_gen = ArrayDataGenerator(images, labels, train_idx, cfg['batch_size'], shuffle=True)
+    val_gen = ArrayDataGenerator(images, labels, val_idx, cfg['batch_size'], shuffle=False)
+
+    sign = -1.0 if cfg['metric'] == 'val_loss' else 1.0  # compare as "higher is better"
+
+    def on_epoch_end(epoch, logs):
+        score = sign * float(logs[cfg['metric']])
+        with lock:
+            others = history.get(epoch, [])
+            history[epoch] = others + [score]
+            stop = trial in pruned
+            # Median stopping rule: behind the median of every fold that reached this epoch
+            if not stop and epoch + 1 >= cfg['prune_after'] and len(others) >= cfg['min_reports'] \
+                    and score < float(np.median(others)):
+                pruned[trial] = True
+                stop = True
+        if stop:
+            row['status'] = 'pruned'
+            model.stop_training = True
+
+    start = time.time()
+    fit = model.fit(train_gen, validation_data=val_gen, epochs=cfg['epochs'], verbose=0,
+                    callbacks=[tf.keras.callbacks.LambdaCallback(on_epoch_end=on_epoch_end)])
+    best = int(np.argmax(sign * np.asarray(fit.history[cfg['metric']])))
+    row.update(val_accuracy=float(fit.history['val_accuracy'][best]),
+               val_loss=float(fit.history['val_loss'][best]),
+               epochs=len(fit.history['val_accuracy']),
+               seconds=time.time() - start)
+    tf.keras.backend.clear_session()
+    return row
+
+
+# --- results --------------------------------------------------------------
+def rank_trials(rows, trials, metric='val_accuracy'):
+    """One summary per trial: completed trials first, then by the mean fold `metric` (the other one breaks ties)."""
+    summary = []
+    for trial, params in enumerate(trials):
+        done = [r for r in rows if r['trial'] == trial and r['val_accuracy'] is not None]
+        accs = [r['val_accuracy'] for r in done]
+        status = 'pruned' if any(r['status'] != 'complete' for r in rows if r['trial'] == trial) else 'complete'
+        summary.append({
+            'trial': trial,
+            **params,
+            'status': status,
+            'mean_val_accuracy': float(np.mean(accs)) if accs else 0.0,
+            'std_val_accuracy': float(np.std(accs)) if accs else 0.0,
+            'mean_val_loss': float(np.mean([r['val_loss'] for r in done])) if done else None,
+            'folds_completed': sum(r['status'] == 'complete' for r in done),
+            'fold_accuracies': ';'.join(f"{r['fold']}:{r['val_accuracy']:.4f}" for r in sorted(done, key=lambda r: r['fold'])),
+            'epochs': sum(r['epochs'] for r in done),
+            'seconds': round(sum(r['seconds'] for r in done), 1),
+        })
+    loss = lambda s: s['mean_val_loss'] if s['mean_val_loss'] is not None else float('inf')
+    if metric == 'val_loss':
+        summary.sort(key=lambda s: (s['status'] != 'complete', loss(s), -s['mean_val_accuracy']))
+    else:
+        summary.sort(key=lambda s: (s['status'] != 'complete', -s['mean_val_accuracy'], loss(s)))
+    for rank, s in enumerate(summary, 1):
+        s['rank'] = rank
+    return summary
+
+
+def write_results(summary, output):
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    fields = ['rank'] + [k for k in summary[0] if k != 'rank']
+    with open(output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for s in summary:
+            writer.writerow({k: ('/'.join(map(str, v)) if isinstance(v, tuple) else v) for k, v in s.items()})
+
+
+if __name__ == '__main__':
+    from sklearn.model_selection import StratifiedKFold
+    from dataset.data_loader import load_data_paths
+
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Parallel k-fold cross-validation / hyperparameter sweep")
+    parser.add_argument('--data-dir', default='dataset')
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2',
+                        help="build_simple_cnn argument to sweep, e.g. 'learning_rate=1e-3,3e-4' or 'filters=16/32/64,32/64/128'")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--threads-per-worker', type=int, default=2 if cpus >= 4 else 1)
+    parser.add_argument('--workers', type=int, default=0, help="Worker processes (default: cores / threads per worker)")
+    parser.add_argument('--metric', choices=['val_accuracy', 'val_loss'], default='val_accuracy',
+                        help="Used to pick each fold's best epoch, to prune and to rank")
+    parser.add_argument('--prune-after', type=int, default=5, help="Earliest epoch at which a trial may be stopped")
+    parser.add_argument('--min-reports', type=int, default=4, help="Folds that must have reached an epoch before pruning against it")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--output', default='sweep_results.csv')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    images, labels, classes = load_data_paths(args.data_dir)
+    if not images:
+        print("No images found!")
+        exit()
+    images_path, labels_path = prepare_dataset(images, labels, args.cache_dir, args.image_size)
+    y = np.load(labels_path)
+    valid = np.flatnonzero(y >= 0)
+
+    trials = expand_grid(parse_grid(args.grid))
+    folds = list(StratifiedKFold(args.folds, shuffle=True, random_state=args.seed).split(valid, y[valid]))
+    cfg = {'num_classes': len(classes), 'epochs': args.epochs, 'batch_size': args.batch_size,
+           'metric': args.metric, 'prune_after': args.prune_after, 'min_reports': args.min_reports}
+    # Fold-major order: every trial gets a first fold before any trial gets a second,
+    # so a pruned trial's remaining folds are skipped instead of trained
+    tasks = [(t, f, params, valid[train_idx], valid[val_idx], cfg)
+             for f, (train_idx, val_idx) in enumerate(folds)
+             for t, params in enumerate(trials)]
+
+    workers = args.workers or max(1, cpus // args.threads_per_worker)
+    workers = min(workers, len(tasks))
+    print(f"{len(trials)} trials x {args.folds} folds = {len(tasks)} tasks on {workers} workers "
+          f"({args.threads_per_worker} TF threads each)")
+
+    # spawn: fresh interpreters, so each worker's TF thread settings take effect
+    ctx = mp.get_context('spawn')
+    with ctx.Manager() as manager:
+        shared = (manager.dict(), manager.dict(), manager.Lock())
+        rows = []
+        with ctx.Pool(workers, initializer=init_worker,
+                      initargs=(images_path, labels_path, args.threads_per_worker, shared)) as pool:
+            for row in pool.imap_unordered(run_task, tasks):
+                rows.append(row)
+                acc = f"{row['val_accuracy']:.4f}" if row['val_accuracy'] is not None else '-'
+                print(f"[{len(rows)}/{len(tasks)}] trial {row['trial']} fold {row['fold']}: "
+                      f"{row['status']}, val_accuracy={acc}, epochs={row['epochs']}, {row['seconds']:.0f}s")
+
+    summary = rank_trials(rows, trials, args.metric)
+    write_results(summary, args.output)
+    print(f"\n--- Sweep Results (ranked, {args.output}) ---")
+    print(f"{'rank':<6}{'trial':<7}{'status':<10}{'accuracy':>10}{'std':>8}{'loss':>8}  params")
+    for s in summary:
+        params = {k: s[k] for k in trials[s['trial']]}
+        loss = f"{s['mean_val_loss']:.3f}" if s['mean_val_loss'] is not None else '-'
+        print(f"{s['rank']:<6}{s['trial']:<7}{s['status']:<10}{s['mean_val_accuracy']:>10.3f}"
+              f"{s['std_val_accuracy']:>8.3f}{loss:>8}  {params}")
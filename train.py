@@ -4,67 +4,106 @@ import os
 import numpy as np
 
 
-def build_simple_cnn(input_shape, num_classes):
+def build_simple_cnn(input_shape, num_classes, filters=(32, 64, 128), dense_units=128,
+                     dropout=0.5, learning_rate=1e-3):
     """
     A lightweight CNN designed for small medical datasets.
     Functional API implementation for Grad-CAM compatibility.
+    The keyword arguments are the hyperparameters explored by sweep.py; the
+    defaults are the architecture the served weights were trained with.
     """
     inputs = layers.Input(shape=input_shape)
     
     # Block 1
-    x = layers.Conv2D(32, (3, 3), activation='relu')(inputs)
+    x = layers.Conv2D(filters[0], (3, 3), activation='relu')(inputs)
     x = layers.MaxPooling2D((2, 2))(x)
     
     # Block 2
-    x = layers.Conv2D(64, (3, 3), activation='relu')(x)
+    x = layers.Conv2D(filters[1], (3, 3), activation='relu')(x)
     x = layers.MaxPooling2D((2, 2))(x)
     
     # Block 3
     # Explicitly name this layer 'target_conv_layer' for reliable Grad-CAM
-    x = layers.Conv2D(128, (3, 3), activation='relu', name='target_conv_layer')(x)
+    x = layers.Conv2D(filters[2], (3, 3), activation='relu', name='target_conv_layer')(x)
     x = layers.MaxPooling2D((2, 2))(x)
     
     # Dense Classifier
     x = layers.Flatten()(x)
-    x = layers.Dense(128, activation='relu')(x)
-    x = layers.Dropout(0.5)(x)
+    x = layers.Dense(dense_units, activation='relu')(x)
+    x = layers.Dropout(dropout)(x)
     
     # OUTPUT LAYER
     outputs = layers.Dense(num_classes, activation='softmax')(x)
     
     model = models.Model(inputs=inputs, outputs=outputs)
     
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+                  loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def build_compact_cnn(input_shape, num_classes, dense_units=128, dropout=0.3):
+    """
+    Compact serving model, trained from build_simple_cnn's soft labels (distill.py).
+    Depthwise-separable convolutions and a global-average-pooling head replace the
+    Flatten -> Dense block that holds most of the teacher's weights.
+    Keeps 'target_conv_layer' for Grad-CAM and a Dense(128) layer for embeddings.
+    """
+    inputs = layers.Input(shape=input_shape)
+
+    # Stem: 224 -> 112
+    x = layers.Conv2D(16, (3, 3), strides=(2, 2), padding='same', use_bias=False)(inputs)
+    x = layers.BatchNormalization()(x)
+    x = layers.ReLU()(x)
+
+    # Depthwise-separable blocks: 112 -> 56 -> 28
+    for filters in (32, 64):
+        x = layers.SeparableConv2D(filters, (3, 3), padding='same', use_bias=False)(x)
+        x = layers.BatchNormalization()(x)
+        x = layers.ReLU()(x)
+        x = layers.MaxPooling2D((2, 2))(x)
+
+    # Same name as in build_simple_cnn so Grad-CAM works unchanged (28x28 map)
+    x = layers.SeparableConv2D(128, (3, 3), padding='same', activation='relu', name='target_conv_layer')(x)
+
+    # Pooled head instead of Flatten
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dense(dense_units, activation='relu')(x)
+    x = layers.Dropout(dropout)(x)
+    outputs = layers.Dense(num_classes, activation='softmax')(x)
+
+    model = models.Model(inputs=inputs, outputs=outputs)
+
     model.compile(optimizer='adam',
                   loss='sparse_categorical_crossentropy',
                   metrics=['accuracy'])
     return model
 
 
-from dataset.data_loader import load_data_paths, ThyroidDataGenerator
+# Servable model variants: builder and default weights file (THYROID_MODEL in the backend)
+MODEL_VARIANTS = {
+    'cnn': (build_simple_cnn, os.path.join('models', 'thyroid_model.h5')),
+    'student': (build_compact_cnn, os.path.join('models', 'thyroid_student.weights.h5')),
+}
+
+
+from dataset.data_loader import load_data_paths, ThyroidDataGenerator, MixedDataGenerator
 from sklearn.model_selection import train_test_split
+import argparse
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the thyroid classifier")
+    parser.add_argument('--gan', action='append', default=[], metavar='CLASS=PATH',
+                        help="Generator for a class, e.g. 'Medullary Thyroid Carcinoma=models/gan_generator_medullary_thyroid_carcinoma.h5'")
+    parser.add_argument('--synthetic-ratio', action='append', default=[], metavar='CLASS=RATIO',
+                        help="Synthetic samples per batch for a class, as a fraction of the batch size (default 0.25)")
+    args = parser.parse_args()
+
     print("Loading Data...")
     data_dir = "dataset"
-    # Manual walk since load_data_paths is TODO
-    images = []
-    labels = []
-    classes = [
-        'Benign', 
-        'Papillary Thyroid Carcinoma', 
-        'Follicular Thyroid Carcinoma', 
-        'Anaplastic Thyroid Carcinoma',
-        'Medullary Thyroid Carcinoma'
-    ]
-    
-    for label_idx, cat in enumerate(classes):
-        cat_dir = os.path.join(data_dir, cat)
-        if not os.path.exists(cat_dir): continue
-        for fname in os.listdir(cat_dir):
-            if fname.lower().endswith(('.png', '.jpg', '.jpeg')):
-                images.append(os.path.join(cat_dir, fname))
-                labels.append(label_idx)
-    
+    images, labels, classes = load_data_paths(data_dir)
+
     if not images:
         print("No images found!")
         exit()
@@ -85,6 +124,18 @@ if __name__ == '__main__':
     # Generators
     train_gen = ThyroidDataGenerator(X_train, y_train, batch_size=16, shuffle=True) 
     val_gen = ThyroidDataGenerator(X_val, y_val, batch_size=16, shuffle=False)
+
+    # Optional on-the-fly GAN augmentation (e.g. to top up the small Medullary class)
+    if args.gan:
+        ratios = dict(arg.split('=', 1) for arg in args.synthetic_ratio)
+        generators = {}
+        synthetic_ratio = {}
+        for arg in args.gan:
+            cls, path = arg.split('=', 1)
+            generators[classes.index(cls)] = tf.keras.models.load_model(path, compile=False)
+            synthetic_ratio[classes.index(cls)] = float(ratios.get(cls, 0.25))
+        print(f"GAN augmentation: {synthetic_ratio} (class index -> ratio)")
+        train_gen = MixedDataGenerator(train_gen, generators, synthetic_ratio)
     
     print("Building Simple CNN (Optimized for Small Data)...")
     # We still pass num_classes=5, so it STILL detects:
@@ -0,0 +1,113 @@
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+
+# Test-time augmentation: the same kinds of changes ThyroidDataGenerator applies while
+# training (horizontal flip, +/- 20 degree rotation) plus a small gain change, built as
+# one batch so the model runs a single forward pass for all views.
+
+# (horizontal flip, rotation in degrees, intensity gain); the first entry is the original image
+TTA_VIEWS = [
+    (False, 0, 1.0),
+    (True, 0, 1.0),
+    (False, 10, 1.0),
+    (False, -10, 1.0),
+    (True, 10, 1.0),
+    (True, -10, 1.0),
+    (False, 0, 0.9),
+    (False, 0, 1.1),
+    (False, 20, 1.0),
+    (False, -20, 1.0),
+]
+DEFAULT_TTA_VIEWS = 8
+
+
+def build_tta_batch(img, n_views=DEFAULT_TTA_VIEWS):
+    """Stack `n_views` augmented copies of a normalised (H, W, 3) image into one batch."""
+    views = TTA_VIEWS[:max(1, min(n_views, len(TTA_VIEWS)))]
+    h, w = img.shape[:2]
+    batch = np.repeat(img[np.newaxis].astype(np.float32), len(views), axis=0)
+
+    flips = np.array([flip for flip, _, _ in views])
+    batch[flips] = batch[flips, :, ::-1]
+
+    for i, (_, angle, _) in enumerate(views):
+        if angle:
+            M = cv2.getRotationMatrix2D((w/2, h/2), angle, 1)
+            batch[i] = cv2.warpAffine(batch[i], M, (w, h))
+
+    gains = np.array([gain for _, _, gain in views], dtype=np.float32)
+    batch *= gains[:, None, None, None]
+    return np.clip(batch, 0.0, 1.0)
+
+
+def predict_with_tta(model, img, n_views=DEFAULT_TTA_VIEWS):
+    """Average class probabilities over the TTA views of one image (single forward pass)."""
+    batch = build_tta_batch(img, n_views)
+    probs = np.asarray(model(batch, training=False))
+    return probs.mean(axis=0)
+
+
+def evaluate(model, images, labels, n_views):
+    """Compare single-view and TTA accuracy/latency over a labelled set of image paths."""
+    stats = {'single': [0, 0.0], 'tta': [0, 0.0]}
+    total = 0
+    # Warm up both batch shapes so graph tracing isn't counted as latency
+    warmup = np.zeros((224, 224, 3), dtype=np.float32)
+    model(warmup[np.newaxis], training=False)
+    predict_with_tta(model, warmup, n_views)
+    for path, label in zip(images, labels):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        img = cv2.resize(img, (224, 224)) / 255.0
+        total += 1
+
+        start = time.perf_counter()
+        probs = np.asarray(model(img[np.newaxis].astype(np.float32), training=False))[0]
+        stats['single'][1] += time.perf_counter() - start
+        stats['single'][0] += int(np.argmax(probs) == label)
+
+        start = time.perf_counter()
+        probs = predict_with_tta(model, img, n_views)
+        stats['tta'][1] += time.perf_counter() - start
+        stats['tta'][0] += int(np.argmax(probs) == label)
+    return total, stats
+
+
+if __name__ == '__main__':
+    from train import MODEL_VARIANTS
+    from dataset.data_loader import load_data_paths
+
+    parser = argparse.ArgumentParser(description="Latency/accuracy report for test-time augmentation")
+    parser.add_argument('--views', type=int, default=DEFAULT_TTA_VIEWS)
+    parser.add_argument('--limit', type=int, default=0, help="Max images per class (0 = all)")
+    parser.add_argument('--model', choices=sorted(MODEL_VARIANTS), default='cnn')
+    parser.add_argument('--weights', help="Default: the model's weights file")
+    args = parser.parse_args()
+    build_model, default_weights = MODEL_VARIANTS[args.model]
+
+    images, labels, classes = load_data_paths('dataset')
+    if args.limit:
+        # load_data_paths lists each class in sorted order; keep the first N of each
+        seen = [0] * len(classes)
+        keep = []
+        for i, label in enumerate(labels):
+            seen[label] += 1
+            if seen[label] <= args.limit:
+                keep.append(i)
+        images, labels = [images[i] for i in keep], [labels[i] for i in keep]
+
+    model = build_model((224, 224, 3), len(classes))
+    model.load_weights(args.weights or default_weights)
+
+    total, stats = evaluate(model, images, labels, args.views)
+    if not total:
+        print("No images found!")
+        exit()
+    print(f"\n--- TTA Report ({total} images, {args.views} views) ---")
+    print(f"{'mode':<8}{'accuracy':>10}{'ms/image':>10}")
+    for mode, (correct, seconds) in stats.items():
+        print(f"{mode:<8}{correct / total:>10.3f}{1000 * seconds / total:>10.1f}")